@@ -1,10 +1,147 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, MongoClient
+from pymongo.errors import CollectionInvalid
+from app.utils.metrics import MongoCommandTimer
+import asyncio
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "secure_file_sharing")
 
-client = AsyncIOMotorClient(MONGO_URL)
-db = client["secure_file_sharing"] 
\ No newline at end of file
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+# zstd and snappy need the optional zstandard / python-snappy packages; zlib is always available
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# The production launcher creates indexes once before forking and turns this off for its workers
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+
+REVOCATION_LOG_BYTES = int(os.getenv("REVOCATION_LOG_BYTES", str(16 * 1024 * 1024)))
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "365"))
+# The expiry pass removes expired files with their links, refcounts and stats; the TTL index
+# only catches what it has not reached this long after expiry
+FILE_EXPIRY_TTL_GRACE_SECONDS = int(os.getenv("FILE_EXPIRY_TTL_GRACE_SECONDS", str(24 * 3600)))
+
+# create_collection options, applied before first use: an insert would create a plain collection
+COLLECTION_OPTIONS = {
+    # Must hold every revocation younger than DOWNLOAD_TOKEN_EXPIRE_MINUTES; ~150 bytes each
+    "token_revocations": {"capped": True, "size": REVOCATION_LOG_BYTES},
+    # Time series: compressed by time bucket, and expired by bucket instead of per document
+    "audit_events": {
+        "timeseries": {"timeField": "at", "metaField": "meta", "granularity": "seconds"},
+        "expireAfterSeconds": AUDIT_RETENTION_DAYS * 24 * 3600,
+    },
+}
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("verification_token", ASCENDING)], sparse=True),
+    ],
+    "files": [
+        IndexModel([("uploaded_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("file_type", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("filename", ASCENDING)]),
+        IndexModel([("blob_id", ASCENDING)]),
+        IndexModel([("thumbnail.blob_id", ASCENDING)], sparse=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=FILE_EXPIRY_TTL_GRACE_SECONDS),
+        # Collections allow a single text index; it covers names and extracted document text
+        IndexModel(
+            [("filename", TEXT), ("text", TEXT)],
+            weights={"filename": 10, "text": 1},
+            name="files_text_search"
+        ),
+    ],
+    "upload_sessions": [
+        IndexModel([("expires_at", ASCENDING)]),
+    ],
+    "download_bundles": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("run_after", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "download_link_uses": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "audit_events": [
+        IndexModel([("meta.actor", ASCENDING), ("at", DESCENDING)]),
+        IndexModel([("meta.type", ASCENDING), ("at", DESCENDING)]),
+        IndexModel([("file_id", ASCENDING), ("at", DESCENDING)]),
+    ],
+    "storage_stats_daily": [
+        IndexModel([("date", DESCENDING)]),
+    ],
+    "upload_parts": [
+        IndexModel([("upload_id", ASCENDING), ("part_number", ASCENDING)], unique=True),
+    ],
+}
+
+def _client_options():
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "event_listeners": [MongoCommandTimer()],
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+# Motor connects lazily, so building the client here does no I/O at import time
+client = AsyncIOMotorClient(MONGO_URL, **_client_options())
+db = client[MONGO_DB_NAME]
+
+async def ensure_indexes():
+    existing = await db.list_collection_names()
+    for collection, options in COLLECTION_OPTIONS.items():
+        if collection not in existing:
+            try:
+                await db.create_collection(collection, **options)
+            except CollectionInvalid:
+                pass  # another worker created it first
+    for collection, indexes in INDEXES.items():
+        await db[collection].create_indexes(indexes)
+
+def ensure_indexes_sync():
+    """Declare collections and indexes over a short-lived blocking client, before any event loop exists."""
+    sync_client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS)
+    sync_db = sync_client[MONGO_DB_NAME]
+    try:
+        existing = sync_db.list_collection_names()
+        for collection, options in COLLECTION_OPTIONS.items():
+            if collection not in existing:
+                sync_db.create_collection(collection, **options)
+        for collection, indexes in INDEXES.items():
+            sync_db[collection].create_indexes(indexes)
+    finally:
+        sync_client.close()
+
+async def warm_pool():
+    # Concurrent pings each check out a connection, so the first requests skip the TCP/TLS/auth handshakes
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(MONGO_MIN_POOL_SIZE)))
+
+async def connect_db():
+    """Open and warm the pool, fail fast if the server is unreachable and declare indexes."""
+    await client.admin.command("ping")
+    await warm_pool()
+    if MONGO_ENSURE_INDEXES:
+        await ensure_indexes()
+
+def close_db():
+    client.close()
@@ -1,19 +1,62 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import Request
-from app.routes import auth_routes, file_routes
+from contextlib import asynccontextmanager
+from app.routes import auth_routes, file_routes, chunked_upload_routes, job_routes, ops_routes
+from app.db.mongo import connect_db, close_db
+from app.utils.auth_utils import shutdown_password_pool
+from app.utils.job_queue import start_job_workers
+from app.utils.download_tokens import sync_revocations_forever
+from app.utils.audit import start_audit_writer, stop_audit_writer
+from app.utils.stats import maintain_stats_forever
+from app.utils.retention import sweep_storage_forever, expire_files_forever
+from app.utils.metrics import MetricsMiddleware, monitor_event_loop_lag, render_metrics
+from app.utils.rate_limit import ConcurrencyLimitMiddleware
+from app.utils.upload_utils import UPLOAD_DIR
+from app.server import is_draining
+import asyncio
 import os
 
-app = FastAPI(title="Secure File Sharing System")
+RUNTIME_DIRS = ("static/css", "static/js", "templates", UPLOAD_DIR)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for directory in RUNTIME_DIRS:
+        os.makedirs(directory, exist_ok=True)
+    await connect_db()
+    gc_task = asyncio.create_task(chunked_upload_routes.collect_expired_sessions_forever())
+    lag_task = asyncio.create_task(monitor_event_loop_lag())
+    revocation_task = asyncio.create_task(sync_revocations_forever())
+    audit_task = start_audit_writer()
+    stats_task = asyncio.create_task(maintain_stats_forever())
+    sweep_task = asyncio.create_task(sweep_storage_forever())
+    expiry_task = asyncio.create_task(expire_files_forever())
+    job_workers = start_job_workers()
+    yield
+    gc_task.cancel()
+    lag_task.cancel()
+    revocation_task.cancel()
+    stats_task.cancel()
+    sweep_task.cancel()
+    expiry_task.cancel()
+    for worker in job_workers:
+        worker.cancel()
+    # Let cancelled jobs hand themselves back to the queue before the client closes
+    await asyncio.gather(*job_workers, return_exceptions=True)
+    # Connections have drained by now, so no more events are coming; write the rest out
+    await stop_audit_writer(audit_task)
+    close_db()
+    shutdown_password_pool()
 
-os.makedirs("static/css", exist_ok=True)
-os.makedirs("static/js", exist_ok=True)
-os.makedirs("templates", exist_ok=True)
+app = FastAPI(title="Secure File Sharing System", lifespan=lifespan)
+app.add_middleware(ConcurrencyLimitMiddleware)
+# Added last so it is outermost and also sees requests refused by the limits
+app.add_middleware(MetricsMiddleware)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Created in the lifespan, not at import, so every worker import stays free of side effects
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
 templates = Jinja2Templates(directory="templates")
 
 @app.get("/web", response_class=HTMLResponse)
@@ -26,7 +69,17 @@ def api_root():
 
 @app.get("/health")
 def health_check():
+    if is_draining():
+        # Tells the load balancer to stop routing here while in-flight transfers finish
+        return JSONResponse({"status": "draining"}, status_code=503)
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 app.include_router(auth_routes.router, prefix="/auth")
 app.include_router(file_routes.router, prefix="/file")
+app.include_router(chunked_upload_routes.router, prefix="/file/uploads")
+app.include_router(job_routes.router, prefix="/jobs")
+app.include_router(ops_routes.router, prefix="/ops")
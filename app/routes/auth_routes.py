@@ -1,29 +1,44 @@
 from app.db.mongo import db
-from app.utils.auth_utils import hash_password, verify_password, create_jwt_token
+from app.utils.auth_utils import hash_password_async, verify_and_update_password, create_jwt_token
+from app.utils.rate_limit import enforce_auth_rate_limit
 from app.schemas.user_schema import UserCreate, UserLogin
-from fastapi import APIRouter, HTTPException, Depends, Form
+from fastapi import APIRouter, HTTPException, Depends, Form, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt
+from pymongo.errors import DuplicateKeyError
 import uuid
 
 router = APIRouter()
 
+async def _check_password(db_user, password: str):
+    if not db_user:
+        return False
+    valid, new_hash = await verify_and_update_password(password, db_user["password"])
+    if valid and new_hash:
+        # Stored hash used a different bcrypt cost; upgrade it while we have the plaintext
+        await db.users.update_one({"_id": db_user["_id"]}, {"$set": {"password": new_hash}})
+    return valid
+
 @router.post("/client/signup")
-async def client_signup(user: UserCreate):
+async def client_signup(user: UserCreate, request: Request):
+    await enforce_auth_rate_limit(request, user.email)
     existing = await db.users.find_one({"email": user.email})
     if existing:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    hashed_pw = hash_password(user.password)
+    hashed_pw = await hash_password_async(user.password)
     verification_token = str(uuid.uuid4())
     
-    await db.users.insert_one({
-        "email": user.email, 
-        "password": hashed_pw, 
-        "role": "client",
-        "verified": False,
-        "verification_token": verification_token
-    })
+    try:
+        await db.users.insert_one({
+            "email": user.email, 
+            "password": hashed_pw, 
+            "role": "client",
+            "verified": False,
+            "verification_token": verification_token
+        })
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
 
     encrypted_url = f"http://127.0.0.1:8009/auth/verify-email/{verification_token}"
 
@@ -47,9 +62,10 @@ async def verify_email(token: str):
     return {"message": "Email verified successfully"}
 
 @router.post("/client/login")
-async def client_login(user: UserLogin):
+async def client_login(user: UserLogin, request: Request):
+    await enforce_auth_rate_limit(request, user.email)
     db_user = await db.users.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+    if not await _check_password(db_user, user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not db_user.get("verified", False):
@@ -59,9 +75,10 @@ async def client_login(user: UserLogin):
     return {"access_token": token, "token_type": "bearer"}
 
 @router.post("/ops/login")
-async def ops_login(user: UserLogin):
+async def ops_login(user: UserLogin, request: Request):
+    await enforce_auth_rate_limit(request, user.email)
     db_user = await db.users.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+    if not await _check_password(db_user, user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if db_user.get("role") != "ops":
@@ -71,9 +88,10 @@ async def ops_login(user: UserLogin):
     return {"access_token": token, "token_type": "bearer"}
 
 @router.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    await enforce_auth_rate_limit(request, form_data.username)
     db_user = await db.users.find_one({"email": form_data.username})
-    if not db_user or not verify_password(form_data.password, db_user["password"]):
+    if not await _check_password(db_user, form_data.password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     
     role = db_user.get("role", "client")
@@ -0,0 +1,253 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, Header
+from starlette.concurrency import run_in_threadpool
+from app.utils.auth_utils import verify_user_type, get_current_user
+from app.utils.upload_utils import UPLOAD_DIR, MAX_FILE_SIZE, write_stream_atomic, iter_file
+from app.utils.blob_store import store_blob, add_blob_reference
+from app.utils.metadata_cache import cache_file_meta
+from app.utils.file_processing import enqueue_file_processing
+from app.utils.stats import record_files_added
+from app.utils.retention import expiry_for
+from app.utils.audit import record_event
+from app.utils.rate_limit import client_ip
+from app.schemas.file_schema import UploadSessionCreate, UploadSessionComplete
+from app.routes.file_routes import ALLOWED_EXTENSIONS, _new_file_meta
+from app.db.mongo import db
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+SESSION_DIR = os.path.join(UPLOAD_DIR, ".sessions")
+
+UPLOAD_PART_MAX_SIZE = int(os.getenv("UPLOAD_PART_MAX_SIZE", str(64 * 1024 * 1024)))
+UPLOAD_MAX_PARTS = int(os.getenv("UPLOAD_MAX_PARTS", "10000"))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+UPLOAD_SESSION_GC_INTERVAL_SECONDS = int(os.getenv("UPLOAD_SESSION_GC_INTERVAL_SECONDS", "600"))
+
+def _require_ops(user_type: str):
+    if user_type != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can upload files")
+
+def _session_path(upload_id: str):
+    return os.path.join(SESSION_DIR, upload_id)
+
+def _part_path(upload_id: str, part_number: int):
+    return os.path.join(SESSION_DIR, upload_id, f"{part_number:05d}.part")
+
+def _missing_parts(upload_id: str, parts: list):
+    return [part for part in parts if not os.path.exists(_part_path(upload_id, part["part_number"]))]
+
+async def _get_session(upload_id: str):
+    session = await db.upload_sessions.find_one({"_id": upload_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session["expires_at"] < datetime.utcnow():
+        raise HTTPException(status_code=410, detail="Upload session expired")
+    return session
+
+async def _discard_session(upload_id: str):
+    await run_in_threadpool(shutil.rmtree, _session_path(upload_id), True)
+    await db.upload_parts.delete_many({"upload_id": upload_id})
+    await db.upload_sessions.delete_one({"_id": upload_id})
+
+@router.post("")
+async def init_upload(
+    body: UploadSessionCreate,
+    user_type: str = Depends(verify_user_type)
+):
+    _require_ops(user_type)
+
+    filename = os.path.basename(body.filename)
+    ext = filename.split(".")[-1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+
+    upload_id = uuid.uuid4().hex
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    await run_in_threadpool(os.makedirs, _session_path(upload_id), exist_ok=True)
+    await db.upload_sessions.insert_one({
+        "_id": upload_id,
+        "filename": filename,
+        "file_type": ext,
+        "file_expires_at": expiry_for(body.expires_in_days),
+        # Bytes held by the parts so far, capped at MAX_FILE_SIZE
+        "size": 0,
+        "created_at": now,
+        "expires_at": expires_at
+    })
+
+    return {
+        "upload_id": upload_id,
+        "max_part_size": UPLOAD_PART_MAX_SIZE,
+        "max_parts": UPLOAD_MAX_PARTS,
+        "expires_at": expires_at
+    }
+
+@router.put("/{upload_id}/parts/{part_number}")
+async def upload_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    x_checksum_sha256: Optional[str] = Header(None),
+    user_type: str = Depends(verify_user_type)
+):
+    _require_ops(user_type)
+    if not 1 <= part_number <= UPLOAD_MAX_PARTS:
+        raise HTTPException(status_code=400, detail=f"Part number must be between 1 and {UPLOAD_MAX_PARTS}")
+
+    session = await _get_session(upload_id)
+    previous = await db.upload_parts.find_one({"upload_id": upload_id, "part_number": part_number}, {"size": 1})
+    previous_size = previous["size"] if previous else 0
+    # A re-sent part replaces its earlier bytes rather than adding to them
+    remaining = MAX_FILE_SIZE - session.get("size", 0) + previous_size
+
+    hasher = hashlib.sha256()
+
+    async def accept(size: int):
+        # Runs before the rename, so a bad retry never replaces a part that was already accepted
+        if x_checksum_sha256 and x_checksum_sha256.lower() != hasher.hexdigest():
+            raise HTTPException(status_code=400, detail="Part checksum mismatch")
+        # Conditional, so parts sent in parallel cannot together go past MAX_FILE_SIZE
+        delta = size - previous_size
+        result = await db.upload_sessions.update_one(
+            {"_id": upload_id, "size": {"$not": {"$gt": MAX_FILE_SIZE - delta}}},
+            {"$inc": {"size": delta}}
+        )
+        if not result.matched_count:
+            raise HTTPException(status_code=413, detail="File too large")
+
+    size = await write_stream_atomic(
+        request.stream(), _part_path(upload_id, part_number),
+        min(UPLOAD_PART_MAX_SIZE, max(remaining, 0)), hasher, accept
+    )
+    checksum = hasher.hexdigest()
+
+    now = datetime.utcnow()
+    await db.upload_parts.update_one(
+        {"upload_id": upload_id, "part_number": part_number},
+        {"$set": {"size": size, "sha256": checksum, "uploaded_at": now}},
+        upsert=True
+    )
+    await db.upload_sessions.update_one(
+        {"_id": upload_id},
+        {"$set": {"expires_at": now + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)}}
+    )
+
+    return {"upload_id": upload_id, "part_number": part_number, "size": size, "sha256": checksum}
+
+@router.get("/{upload_id}")
+async def get_upload_status(
+    upload_id: str,
+    user_type: str = Depends(verify_user_type)
+):
+    _require_ops(user_type)
+    session = await _get_session(upload_id)
+
+    parts = []
+    async for part in db.upload_parts.find({"upload_id": upload_id}).sort("part_number", 1):
+        parts.append({
+            "part_number": part["part_number"],
+            "size": part["size"],
+            "sha256": part["sha256"]
+        })
+
+    return {
+        "upload_id": upload_id,
+        "filename": session["filename"],
+        "expires_at": session["expires_at"],
+        "parts": parts
+    }
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(
+    request: Request,
+    upload_id: str,
+    body: Optional[UploadSessionComplete] = None,
+    user: dict = Depends(get_current_user)
+):
+    _require_ops(user["role"])
+    session = await _get_session(upload_id)
+
+    parts = await db.upload_parts.find({"upload_id": upload_id}).sort("part_number", 1).to_list(None)
+    if not parts:
+        raise HTTPException(status_code=400, detail="No parts uploaded")
+    if [part["part_number"] for part in parts] != list(range(1, len(parts) + 1)):
+        raise HTTPException(status_code=400, detail="Parts must be numbered contiguously from 1")
+
+    if body and body.parts is not None:
+        expected = {part.part_number: part.sha256.lower() for part in body.parts}
+        actual = {part["part_number"]: part["sha256"] for part in parts}
+        if expected != actual:
+            raise HTTPException(status_code=400, detail="Part list does not match uploaded parts")
+
+    if sum(part["size"] for part in parts) > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    async def assembled():
+        for part in parts:
+            async for chunk in iter_file(_part_path(upload_id, part["part_number"])):
+                yield chunk
+
+    try:
+        blob = await store_blob(assembled())
+    except FileNotFoundError:
+        missing = await run_in_threadpool(_missing_parts, upload_id, parts)
+        # Forget them, so the upload status shows which parts to send again
+        await db.upload_parts.delete_many({"upload_id": upload_id, "part_number": {"$in": [part["part_number"] for part in missing]}})
+        await db.upload_sessions.update_one({"_id": upload_id}, {"$inc": {"size": -sum(part["size"] for part in missing)}})
+        raise HTTPException(
+            status_code=409, detail=f"Parts missing, upload them again: {[part['part_number'] for part in missing]}"
+        )
+    await add_blob_reference(blob.blob_id, blob.size)
+
+    file_meta = _new_file_meta(session["filename"], session["file_type"], blob, session.get("file_expires_at"))
+    result = await db.files.insert_one(file_meta)
+    await record_files_added([file_meta])
+    await cache_file_meta(file_meta)
+    job_id = await enqueue_file_processing(str(result.inserted_id))
+    await _discard_session(upload_id)
+    record_event(
+        "upload", user["email"], file_id=str(result.inserted_id), filename=file_meta["filename"],
+        size=blob.size, ip=client_ip(request)
+    )
+
+    return {"message": "File uploaded successfully", "file_id": str(result.inserted_id), "job_id": job_id}
+
+@router.delete("/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    user_type: str = Depends(verify_user_type)
+):
+    _require_ops(user_type)
+    session = await db.upload_sessions.find_one({"_id": upload_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+    await _discard_session(upload_id)
+    return {"message": "Upload aborted"}
+
+async def collect_expired_sessions():
+    expired = db.upload_sessions.find({"expires_at": {"$lt": datetime.utcnow()}}, {"_id": 1})
+    removed = 0
+    async for session in expired:
+        await _discard_session(session["_id"])
+        removed += 1
+    return removed
+
+async def collect_expired_sessions_forever():
+    while True:
+        try:
+            await collect_expired_sessions()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Upload session GC failed")
+        await asyncio.sleep(UPLOAD_SESSION_GC_INTERVAL_SECONDS)
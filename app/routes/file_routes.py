@@ -1,108 +1,591 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import FileResponse
-from app.utils.auth_utils import verify_user_type, SECRET_KEY, ALGORITHM
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse, RedirectResponse
+from app.utils.auth_utils import verify_user_type, get_current_user, encode_token, decode_token
+from app.utils.blob_store import (
+    store_upload_file, add_blob_reference, add_blob_references, file_path_for,
+    source_opener_for, offload_path_for, presigned_url_for
+)
+from app.utils.download_utils import build_download_response, make_etag, starts_download
+from app.utils.zip_stream import stream_zip, unique_arcname
+from app.schemas.file_schema import BulkDownloadRequest, BatchUploadResponse, RevokeDownloadLinkRequest, FileListResponse, SearchResponse, FileExpiryUpdate
+from app.utils.responses import negotiated_response, dumps_line
+from app.utils.metadata_cache import get_file_meta, cache_file_meta, invalidate_file_meta
+from app.utils.file_processing import enqueue_file_processing, enqueue_files_processing
+from app.utils.download_tokens import (
+    DOWNLOAD_LINK_MAX_USES, issue_download_token, check_download_token, consume_download_use,
+    revoke_download_token, revoke_file_links
+)
+from app.utils.audit import record_event
+from app.utils.stats import record_files_added
+from app.utils.retention import expiry_for, unexpired, remove_file
+from app.utils.rate_limit import client_ip
 from app.db.mongo import db
-import os
-import shutil
 from jose import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import BulkWriteError, ExecutionTimeout
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import asyncio
+import base64
+import logging
+import os
+import re
+import uuid
 
 router = APIRouter()
-
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
 
 ALLOWED_EXTENSIONS = {"docx", "pptx", "xlsx"}
 
+BULK_DOWNLOAD_MAX_FILES = int(os.getenv("BULK_DOWNLOAD_MAX_FILES", "1000"))
+BULK_DOWNLOAD_CONCURRENCY = int(os.getenv("BULK_DOWNLOAD_CONCURRENCY", "4"))
+_bulk_download_slots = asyncio.Semaphore(BULK_DOWNLOAD_CONCURRENCY)
+
+def _new_file_meta(filename: str, ext: str, blob, expires_at: datetime = None):
+    file_meta = {
+        "filename": os.path.basename(filename),
+        "file_type": ext,
+        "size": blob.size,
+        "blob_id": blob.blob_id,
+        "sha256": blob.blob_id,
+        "etag": make_etag(blob.blob_id),
+        "encrypted": blob.encrypted,
+        "uploader": "ops",
+        "uploaded_at": datetime.utcnow()
+    }
+    if expires_at is not None:
+        file_meta["expires_at"] = expires_at
+    return file_meta
+
+def _extension(filename: str):
+    return (filename or "").split(".")[-1].lower()
+
 @router.post("/upload")
 async def upload_file(
+    request: Request,
     file: UploadFile = File(...),
-    user_type: str = Depends(verify_user_type)
+    expires_in_days: Optional[int] = Query(None, ge=0),
+    user: dict = Depends(get_current_user)
 ):
-    if user_type != "ops":
+    if user["role"] != "ops":
         raise HTTPException(status_code=403, detail="Only Ops can upload files")
     
-    ext = file.filename.split(".")[-1].lower()
+    ext = _extension(file.filename)
     if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Invalid file type")
     
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    blob = await store_upload_file(file)
+    await add_blob_reference(blob.blob_id, blob.size)
 
-    result = await db.files.insert_one({
-        "filename": file.filename,
-        "file_type": ext,
-        "uploader": "ops",
-        "uploaded_at": datetime.utcnow()
-    })
+    file_meta = _new_file_meta(file.filename, ext, blob, expiry_for(expires_in_days))
+    result = await db.files.insert_one(file_meta)
+    await record_files_added([file_meta])
+    await cache_file_meta(file_meta)
+    # Checksums, text extraction and the preview run in the background
+    job_id = await enqueue_file_processing(str(result.inserted_id))
+    record_event(
+        "upload", user["email"], file_id=str(result.inserted_id), filename=file_meta["filename"],
+        size=blob.size, ip=client_ip(request)
+    )
+
+    return {"message": "File uploaded successfully", "file_id": str(result.inserted_id), "job_id": job_id}
+
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "500"))
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))
+
+async def _store_batch_item(file: UploadFile, slots: asyncio.Semaphore):
+    """Return (blob, None) once stored, or (None, reason) if this file is refused."""
+    ext = _extension(file.filename)
+    if ext not in ALLOWED_EXTENSIONS:
+        return None, "Invalid file type"
+    async with slots:
+        try:
+            return await store_upload_file(file), None
+        except HTTPException as error:
+            return None, error.detail
+        except Exception:
+            logger.exception("Could not store batch upload %s", file.filename)
+            return None, "Could not store file"
+
+@router.post("/upload/batch", response_model=BatchUploadResponse, response_model_exclude_none=True)
+async def upload_files(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    expires_in_days: Optional[int] = Query(None, ge=0),
+    user: dict = Depends(get_current_user)
+):
+    """Upload many files in one request. Each file succeeds or fails on its own."""
+    if user["role"] != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can upload files")
+    if len(files) > BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_UPLOAD_MAX_FILES} files per batch")
+
+    slots = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+    stored = await asyncio.gather(*(_store_batch_item(file, slots) for file in files))
+
+    results = [{"filename": file.filename, "status": "failed", "error": error} for file, (_, error) in zip(files, stored)]
+    expires_at = expiry_for(expires_in_days)
+    pending = [
+        (index, _new_file_meta(file.filename, _extension(file.filename), blob, expires_at), blob)
+        for index, (file, (blob, _)) in enumerate(zip(files, stored)) if blob is not None
+    ]
+
+    inserted = []
+    if pending:
+        try:
+            await db.files.insert_many([file_meta for _, file_meta, _ in pending], ordered=False)
+            inserted = pending
+        except BulkWriteError as error:
+            failed = {pending[write_error["index"]][0] for write_error in error.details["writeErrors"]}
+            inserted = [item for item in pending if item[0] not in failed]
+            for index in failed:
+                results[index]["error"] = "Could not save file metadata"
+
+    if inserted:
+        await add_blob_references(blob for _, _, blob in inserted)
+        await record_files_added(file_meta for _, file_meta, _ in inserted)
+        await asyncio.gather(*(cache_file_meta(file_meta) for _, file_meta, _ in inserted))
+        file_ids = [str(file_meta["_id"]) for _, file_meta, _ in inserted]
+        job_ids = await enqueue_files_processing(file_ids)
+        ip = client_ip(request)
+        for (index, file_meta, blob), file_id, job_id in zip(inserted, file_ids, job_ids):
+            results[index] = {
+                "filename": files[index].filename, "status": "uploaded", "file_id": file_id, "job_id": job_id
+            }
+            record_event(
+                "upload", user["email"], file_id=file_id, filename=file_meta["filename"], size=blob.size, ip=ip
+            )
+
+    return {"uploaded": len(inserted), "failed": len(files) - len(inserted), "results": results}
+
+LIST_PROJECTION = {"filename": 1, "file_type": 1, "uploader": 1, "uploaded_at": 1}
+LIST_SORT = [("uploaded_at", -1), ("_id", -1)]
+
+def _encode_cursor(file: dict):
+    raw = f"{file['uploaded_at'].isoformat()}|{file['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        uploaded_at, file_id = raw.split("|", 1)
+        return datetime.fromisoformat(uploaded_at), ObjectId(file_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    return {"message": "File uploaded successfully", "file_id": str(result.inserted_id)}
+def _list_filter(file_type, uploaded_after, uploaded_before, prefix):
+    query = {"expires_at": unexpired()}
+    if file_type:
+        query["file_type"] = file_type.lower()
+    if uploaded_after or uploaded_before:
+        query["uploaded_at"] = {}
+        if uploaded_after:
+            query["uploaded_at"]["$gte"] = uploaded_after
+        if uploaded_before:
+            query["uploaded_at"]["$lt"] = uploaded_before
+    if prefix:
+        query["filename"] = {"$regex": f"^{re.escape(prefix)}"}
+    return query
 
-@router.get("/list")
-async def list_all_files(user_type: str = Depends(verify_user_type)):
+def _list_item(file: dict):
+    return {
+        "file_id": str(file["_id"]),
+        "filename": file["filename"],
+        "file_type": file["file_type"],
+        "uploader": file["uploader"],
+        "uploaded_at": file.get("uploaded_at", "")
+    }
+
+async def _export_ndjson(query: dict):
+    cursor = db.files.find(query, LIST_PROJECTION).sort(LIST_SORT).batch_size(1000)
+    async for file in cursor:
+        yield dumps_line(_list_item(file))
+
+@router.get("/list", response_model=FileListResponse)
+async def list_all_files(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    file_type: Optional[str] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    prefix: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    user_type: str = Depends(verify_user_type)
+):
     if user_type != "client":
         raise HTTPException(status_code=403, detail="Only clients can list files")
-    
-    files = []
-    async for file in db.files.find():
-        files.append({
-            "file_id": str(file["_id"]),
-            "filename": file["filename"],
-            "file_type": file["file_type"],
-            "uploader": file["uploader"],
-            "uploaded_at": file.get("uploaded_at", "")
-        })
-    
-    return {"files": files, "total_files": len(files)}
+
+    query = _list_filter(file_type, uploaded_after, uploaded_before, prefix)
+
+    if format == "ndjson":
+        return StreamingResponse(_export_ndjson(query), media_type="application/x-ndjson")
+
+    if cursor:
+        last_uploaded_at, last_id = _decode_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"uploaded_at": {"$lt": last_uploaded_at}},
+            {"uploaded_at": last_uploaded_at, "_id": {"$lt": last_id}}
+        ]}]}
+
+    page = await db.files.find(query, LIST_PROJECTION).sort(LIST_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = _encode_cursor(page[limit - 1]) if len(page) > limit else None
+    files = [_list_item(file) for file in page[:limit]]
+
+    # Rows are already plain str/datetime, so they skip FastAPI's generic encoder
+    return negotiated_response(request, {"files": files, "total_files": len(files), "next_cursor": next_cursor})
+
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))
+SEARCH_MAX_TIME_MS = int(os.getenv("SEARCH_MAX_TIME_MS", "2000"))
+SEARCH_PROJECTION = {**LIST_PROJECTION, "page_count": 1, "score": {"$meta": "textScore"}}
+
+@router.get("/search", response_model=SearchResponse)
+async def search_files(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(20, ge=1, le=100),
+    page: int = Query(1, ge=1),
+    file_type: Optional[str] = None,
+    user_type: str = Depends(verify_user_type)
+):
+    if user_type != "client":
+        raise HTTPException(status_code=403, detail="Only clients can search files")
+
+    skip = (page - 1) * limit
+    if skip + limit > SEARCH_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"Only the first {SEARCH_MAX_RESULTS} results can be paged through")
+
+    # The text index stems and drops stop words; filename matches weigh 10x body text
+    query = {"$text": {"$search": q}, "expires_at": unexpired()}
+    if file_type:
+        query["file_type"] = file_type.lower()
+
+    try:
+        hits = await (
+            db.files.find(query, SEARCH_PROJECTION)
+            .sort([("score", {"$meta": "textScore"}), ("_id", -1)])
+            .skip(skip)
+            .limit(limit + 1)
+            .max_time_ms(SEARCH_MAX_TIME_MS)
+            .to_list(limit + 1)
+        )
+    except ExecutionTimeout:
+        raise HTTPException(status_code=503, detail="Search timed out, please refine the query")
+
+    results = [
+        {**_list_item(hit), "page_count": hit.get("page_count"), "score": round(hit["score"], 4)}
+        for hit in hits[:limit]
+    ]
+    return negotiated_response(request, {
+        "results": results,
+        "page": page,
+        "next_page": page + 1 if len(hits) > limit and skip + limit < SEARCH_MAX_RESULTS else None
+    })
 
 @router.get("/download/{file_id}")
 async def get_download_link(
+    request: Request,
     file_id: str,
-    user_type: str = Depends(verify_user_type)
+    max_uses: int = Query(DOWNLOAD_LINK_MAX_USES, ge=0, le=1000),
+    user: dict = Depends(get_current_user)
 ):
+    user_type = user["role"]
     if user_type != "client":
         raise HTTPException(status_code=403, detail="Only clients can download files")
+    # With a cap configured, every link is limited and none may exceed it
+    if DOWNLOAD_LINK_MAX_USES and not 1 <= max_uses <= DOWNLOAD_LINK_MAX_USES:
+        raise HTTPException(status_code=400, detail=f"max_uses must be between 1 and {DOWNLOAD_LINK_MAX_USES}")
     
     # Verify file exists
-    file_meta = await db.files.find_one({"_id": ObjectId(file_id)})
+    file_meta = await get_file_meta(file_id)
     if not file_meta:
         raise HTTPException(status_code=404, detail="File not found")
     
-    token_payload = {
-        "file_id": file_id,
-        "role": user_type,
-        "exp": datetime.utcnow() + timedelta(minutes=10)
-    }
-    token = jwt.encode(token_payload, SECRET_KEY, algorithm=ALGORITHM)
+    token, jti = issue_download_token(file_id, user, max_uses)
+    record_event("link_issued", user["email"], file_id=file_id, jti=jti, max_uses=max_uses, ip=client_ip(request))
 
     return {
         "download_link": f"http://127.0.0.1:8009/file/actual-download/{token}",
         "message": "success"
     }
 
-@router.get("/actual-download/{token}")
-async def actual_download(token: str):
+def _legacy_validators(file_path: str):
+    # Files uploaded before checksums were recorded get a weak, stat-based ETag
+    stat = os.stat(file_path)
+    return stat.st_size, f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+@router.api_route("/actual-download/{token}", methods=["GET", "HEAD"])
+async def actual_download(token: str, request: Request):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         file_id = payload.get("file_id")
         role = payload.get("role")
 
         if role != "client":
             raise HTTPException(status_code=403, detail="Unauthorized")
 
-        file_meta = await db.files.find_one({"_id": ObjectId(file_id)})
+        check_download_token(payload)
+
+        file_meta = await get_file_meta(file_id)
         if not file_meta:
             raise HTTPException(status_code=404, detail="File not found")
 
-        file_path = os.path.join(UPLOAD_DIR, file_meta["filename"])
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="File missing from server")
+        size, etag = file_meta.get("size"), file_meta.get("etag")
+        if size is None or etag is None:
+            try:
+                size, etag = _legacy_validators(file_path_for(file_meta))
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="File missing from server")
+
+        # A use is any response that serves byte 0, whatever form the Range takes; reads
+        # that resume a download partway through do not use up the link
+        if starts_download(request, size, etag, file_meta["uploaded_at"]):
+            await consume_download_use(payload)
+            record_event(
+                "download", payload.get("sub"), file_id=file_id, filename=file_meta["filename"],
+                jti=payload.get("jti"), ip=client_ip(request)
+            )
+
+        # Limited links are streamed: a redirect would hand out the whole object whatever the Range
+        if request.method == "GET" and not payload.get("max_uses"):
+            presigned_url = presigned_url_for(file_meta)
+            if presigned_url:
+                return RedirectResponse(presigned_url, status_code=307)
+
+        return await build_download_response(
+            request,
+            source_opener_for(file_meta),
+            file_meta["filename"],
+            size,
+            etag,
+            file_meta["uploaded_at"],
+            offload_path=offload_path_for(file_meta)
+        )
 
-        return FileResponse(file_path, filename=file_meta["filename"])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Download link expired")
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Invalid download token")
+
+@router.post("/download/revoke")
+async def revoke_download_link(
+    request: Request,
+    body: RevokeDownloadLinkRequest,
+    user: dict = Depends(get_current_user)
+):
+    # Accept the whole download link as well as the bare token
+    token = body.token.rstrip("/").rsplit("/", 1)[-1]
+    try:
+        payload = decode_token(token)
+    except jwt.JWTError:
+        raise HTTPException(status_code=400, detail="Invalid or expired download token")
+    if not payload.get("jti") or payload.get("role") != "client":
+        raise HTTPException(status_code=400, detail="This link cannot be revoked")
+    if user["role"] != "ops" and payload.get("sub") != user["email"]:
+        raise HTTPException(status_code=403, detail="Only the link owner or Ops can revoke it")
+
+    await revoke_download_token(payload)
+    record_event(
+        "link_revoked", user["email"], file_id=payload.get("file_id"), jti=payload["jti"], ip=client_ip(request)
+    )
+    return {"message": "Download link revoked"}
+
+@router.post("/download/{file_id}/revoke")
+async def revoke_file_download_links(
+    request: Request,
+    file_id: str,
+    user: dict = Depends(get_current_user)
+):
+    if user["role"] != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can revoke all links to a file")
+
+    await revoke_file_links(file_id)
+    record_event("file_links_revoked", user["email"], file_id=file_id, ip=client_ip(request))
+    return {"message": "All current download links to this file revoked"}
+
+@router.delete("/{file_id}")
+async def delete_file(
+    request: Request,
+    file_id: str,
+    user: dict = Depends(get_current_user)
+):
+    if user["role"] != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can delete files")
+    try:
+        object_id = ObjectId(file_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if await remove_file({"_id": object_id}, user["email"], ip=client_ip(request)) is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return {"message": "File deleted", "file_id": file_id}
+
+@router.put("/{file_id}/expiry")
+async def set_file_expiry(
+    request: Request,
+    file_id: str,
+    body: FileExpiryUpdate,
+    user: dict = Depends(get_current_user)
+):
+    """Set when a file is deleted automatically, or clear it with expires_at null."""
+    if user["role"] != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can change file expiry")
+    try:
+        object_id = ObjectId(file_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if body.expires_at is None:
+        update = {"$unset": {"expires_at": ""}}
+    else:
+        # TTL indexes compare naive UTC datetimes
+        expires_at = body.expires_at
+        if expires_at.tzinfo is not None:
+            expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+        update = {"$set": {"expires_at": expires_at}}
+    result = await db.files.update_one({"_id": object_id}, update)
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    await invalidate_file_meta(file_id)
+    record_event("file_expiry_set", user["email"], file_id=file_id, expires_at=body.expires_at, ip=client_ip(request))
+    return {"message": "File expiry updated", "expires_at": body.expires_at}
+
+@router.get("/thumbnail/{file_id}")
+async def get_thumbnail(
+    file_id: str,
+    request: Request,
+    user_type: str = Depends(verify_user_type)
+):
+    if user_type != "client":
+        raise HTTPException(status_code=403, detail="Only clients can download files")
+
+    file_meta = await get_file_meta(file_id)
+    if not file_meta:
+        raise HTTPException(status_code=404, detail="File not found")
+    thumbnail = file_meta.get("thumbnail")
+    if not thumbnail:
+        raise HTTPException(status_code=404, detail="No preview available")
+
+    stem = os.path.splitext(file_meta["filename"])[0]
+    extension = ".png" if thumbnail["media_type"] == "image/png" else ".jpg"
+    return await build_download_response(
+        request,
+        source_opener_for(thumbnail),
+        f"{stem}-preview{extension}",
+        thumbnail["size"],
+        make_etag(thumbnail["blob_id"]),
+        file_meta["processed_at"],
+        offload_path=offload_path_for(thumbnail)
+    )
+
+@router.post("/download/bulk")
+async def get_bulk_download_link(
+    body: BulkDownloadRequest,
+    user: dict = Depends(get_current_user)
+):
+    user_type = user["role"]
+    if user_type != "client":
+        raise HTTPException(status_code=403, detail="Only clients can download files")
+
+    file_ids = list(dict.fromkeys(body.file_ids))
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="No files requested")
+    if len(file_ids) > BULK_DOWNLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_DOWNLOAD_MAX_FILES} files per download")
+    try:
+        object_ids = [ObjectId(file_id) for file_id in file_ids]
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid file id")
+
+    found = {
+        str(file["_id"])
+        async for file in db.files.find({"_id": {"$in": object_ids}, "expires_at": unexpired()}, {"_id": 1})
+    }
+    missing = [file_id for file_id in file_ids if file_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Files not found: {', '.join(missing)}")
 
+    # The id list can be far too long for a URL, so the token only names a stored bundle
+    bundle_id = uuid.uuid4().hex
+    expires_at = datetime.utcnow() + timedelta(minutes=10)
+    await db.download_bundles.insert_one({
+        "_id": bundle_id,
+        "file_ids": file_ids,
+        "created_at": datetime.utcnow(),
+        "expires_at": expires_at
+    })
+    token = encode_token({"bundle_id": bundle_id, "sub": user["email"], "role": user_type, "exp": expires_at})
+
+    return {
+        "download_link": f"http://127.0.0.1:8009/file/actual-download/bulk/{token}",
+        "file_count": len(file_ids),
+        "message": "success"
+    }
+
+ZIP_PROJECTION = {"filename": 1, "file_type": 1, "size": 1, "blob_id": 1, "encrypted": 1, "etag": 1, "uploaded_at": 1}
+
+async def _zip_entries(file_ids: list):
+    metas = {}
+    query = {"_id": {"$in": [ObjectId(file_id) for file_id in file_ids]}, "expires_at": unexpired()}
+    async for file_meta in db.files.find(query, ZIP_PROJECTION):
+        metas[str(file_meta["_id"])] = file_meta
+
+    entries, taken = [], set()
+    for file_id in file_ids:
+        file_meta = metas.get(file_id)
+        if file_meta is None:
+            continue
+        size = file_meta.get("size")
+        if size is None:
+            size = (await run_in_threadpool(os.stat, file_path_for(file_meta))).st_size
+        entries.append((
+            unique_arcname(file_meta["filename"], taken),
+            size,
+            file_meta["uploaded_at"],
+            source_opener_for(file_meta)
+        ))
+    return entries
+
+@router.get("/actual-download/bulk/{token}")
+async def actual_bulk_download(token: str, request: Request):
+    try:
+        payload = decode_token(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Download link expired")
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid download token")
+
+    if payload.get("role") != "client" or not payload.get("bundle_id"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+    bundle = await db.download_bundles.find_one({"_id": payload["bundle_id"]})
+    if not bundle:
+        raise HTTPException(status_code=404, detail="Download bundle not found")
+
+    if _bulk_download_slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many bulk downloads in progress",
+            headers={"Retry-After": "5"}
+        )
+
+    entries = await _zip_entries(bundle["file_ids"])
+    record_event(
+        "download", payload.get("sub"), bundle_id=payload["bundle_id"], file_ids=bundle["file_ids"],
+        ip=client_ip(request)
+    )
+
+    async def archive():
+        async with _bulk_download_slots:
+            async for chunk in stream_zip(entries):
+                yield chunk
+
+    filename = f"files-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={"content-disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from app.utils.auth_utils import verify_user_type
+from app.utils.job_queue import get_job
+from app.utils.responses import negotiated_response
+from app.schemas.file_schema import JobStatus
+
+router = APIRouter()
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def get_job_status(
+    request: Request,
+    job_id: str,
+    user_type: str = Depends(verify_user_type)
+):
+    if user_type != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can view jobs")
+
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return negotiated_response(request, {
+        "job_id": str(job["_id"]),
+        "type": job["type"],
+        "status": job["status"],
+        "file_id": job["payload"].get("file_id"),
+        "attempts": job["attempts"],
+        "error": job.get("error"),
+        "result": job.get("result"),
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at")
+    })
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from app.utils.auth_utils import verify_user_type
+from app.utils.responses import negotiated_response
+from app.schemas.ops_schema import AuditEventPage, StorageStats
+from app.utils.stats import read_totals, read_daily, enqueue_stats_reconciliation
+from app.db.mongo import db
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+from typing import Optional
+import asyncio
+import base64
+
+router = APIRouter()
+
+AUDIT_SORT = [("at", -1), ("_id", -1)]
+
+def _encode_cursor(event: dict):
+    raw = f"{event['at'].isoformat()}|{event['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        at, event_id = raw.split("|", 1)
+        return datetime.fromisoformat(at), ObjectId(event_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _audit_item(event: dict):
+    meta = event.pop("meta", {})
+    event.pop("_id", None)
+    return {**event, "type": meta.get("type"), "actor": meta.get("actor")}
+
+@router.get("/audit", response_model=AuditEventPage)
+async def list_audit_events(
+    request: Request,
+    actor: Optional[str] = None,
+    type: Optional[str] = None,
+    file_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    user_type: str = Depends(verify_user_type)
+):
+    """Audit events newest first. Each filter is served by an (field, at) index."""
+    if user_type != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can view the audit log")
+
+    query = {}
+    if actor:
+        query["meta.actor"] = actor
+    if type:
+        query["meta.type"] = type
+    if file_id:
+        query["file_id"] = file_id
+    if since or until:
+        query["at"] = {}
+        if since:
+            query["at"]["$gte"] = since
+        if until:
+            query["at"]["$lt"] = until
+    if cursor:
+        last_at, last_id = _decode_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"at": {"$lt": last_at}},
+            {"at": last_at, "_id": {"$lt": last_id}}
+        ]}]}
+
+    page = await db.audit_events.find(query).sort(AUDIT_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = _encode_cursor(page[limit - 1]) if len(page) > limit else None
+    events = [_audit_item(event) for event in page[:limit]]
+
+    return negotiated_response(request, {"events": events, "next_cursor": next_cursor})
+
+@router.get("/stats", response_model=StorageStats)
+async def get_storage_stats(
+    request: Request,
+    days: int = Query(30, ge=1, le=90),
+    user_type: str = Depends(verify_user_type)
+):
+    """Totals from the counter shards and precomputed daily rollups; no scan of db.files."""
+    if user_type != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can view storage stats")
+
+    totals, daily = await asyncio.gather(read_totals(), read_daily(days))
+    return negotiated_response(request, {"totals": totals, "daily": daily})
+
+@router.post("/stats/reconcile")
+async def reconcile_storage_stats(user_type: str = Depends(verify_user_type)):
+    """Recount files and blobs in the background and correct any drift in the counters."""
+    if user_type != "ops":
+        raise HTTPException(status_code=403, detail="Only Ops can reconcile storage stats")
+
+    return {"message": "Reconciliation queued", "job_id": await enqueue_stats_reconciliation()}
@@ -0,0 +1,68 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    expires_in_days: Optional[int] = Field(None, ge=0)
+
+class UploadPartChecksum(BaseModel):
+    part_number: int
+    sha256: str
+
+class UploadSessionComplete(BaseModel):
+    parts: Optional[List[UploadPartChecksum]] = None
+
+class RevokeDownloadLinkRequest(BaseModel):
+    token: str
+
+class FileExpiryUpdate(BaseModel):
+    expires_at: Optional[datetime] = None
+
+class BulkDownloadRequest(BaseModel):
+    file_ids: List[str]
+
+class FileListItem(BaseModel):
+    file_id: str
+    filename: str
+    file_type: str
+    uploader: str
+    uploaded_at: datetime
+
+class FileListResponse(BaseModel):
+    files: List[FileListItem]
+    total_files: int
+    next_cursor: Optional[str] = None
+
+class SearchResult(FileListItem):
+    page_count: Optional[int] = None
+    score: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    page: int
+    next_page: Optional[int] = None
+
+class JobStatus(BaseModel):
+    job_id: str
+    type: str
+    status: str
+    file_id: Optional[str] = None
+    attempts: int
+    error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class BatchUploadResult(BaseModel):
+    filename: Optional[str] = None
+    status: str
+    file_id: Optional[str] = None
+    job_id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    uploaded: int
+    failed: int
+    results: List[BatchUploadResult]
@@ -0,0 +1,50 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Dict, List, Optional
+
+class AuditEvent(BaseModel):
+    at: datetime
+    type: str
+    actor: Optional[str] = None
+    file_id: Optional[str] = None
+    bundle_id: Optional[str] = None
+    file_ids: Optional[List[str]] = None
+    filename: Optional[str] = None
+    jti: Optional[str] = None
+    ip: Optional[str] = None
+    size: Optional[int] = None
+    max_uses: Optional[int] = None
+    expires_at: Optional[datetime] = None
+
+class AuditEventPage(BaseModel):
+    events: List[AuditEvent]
+    next_cursor: Optional[str] = None
+
+class TypeTotals(BaseModel):
+    files: int
+    bytes: int
+
+class StorageTotals(BaseModel):
+    files: int
+    bytes: int
+    blobs: int
+    blob_bytes: int
+    by_type: Dict[str, TypeTotals]
+    updated_at: Optional[datetime] = None
+
+class TypeUploads(BaseModel):
+    uploads: int
+    bytes: int
+
+class DailyRollup(BaseModel):
+    date: datetime
+    uploads: int
+    upload_bytes: int
+    downloads: int
+    by_type: Dict[str, TypeUploads]
+    complete: bool
+    computed_at: datetime
+
+class StorageStats(BaseModel):
+    totals: StorageTotals
+    daily: List[DailyRollup]
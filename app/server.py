@@ -0,0 +1,114 @@
+"""Production entry point: python -m app.server
+
+Runs WEB_CONCURRENCY uvicorn workers (default: one per available core) on uvloop and
+httptools when installed. Indexes are created once here, before the workers start,
+and each worker warms its own Mongo pool in the app lifespan.
+
+On SIGTERM a worker first reports draining on /health for SERVER_DRAIN_DELAY_SECONDS so
+the load balancer stops routing to it, then stops accepting connections and lets
+in-flight uploads and downloads finish for up to SERVER_GRACEFUL_TIMEOUT_SECONDS.
+"""
+
+import importlib.util
+import logging
+import os
+import time
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = os.getenv("HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("PORT", "8000"))
+SERVER_KEEPALIVE_SECONDS = int(os.getenv("SERVER_KEEPALIVE_SECONDS", "5"))
+SERVER_DRAIN_DELAY_SECONDS = float(os.getenv("SERVER_DRAIN_DELAY_SECONDS", "5"))
+# Keep below the orchestrator's kill timeout (e.g. terminationGracePeriodSeconds) minus the drain delay
+SERVER_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", "120"))
+SERVER_LOG_LEVEL = os.getenv("SERVER_LOG_LEVEL", "info")
+
+_draining = False
+
+def is_draining():
+    return _draining
+
+def available_cores():
+    try:
+        # Honours CPU pinning and container cpusets, unlike os.cpu_count()
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def worker_count():
+    # An empty WEB_CONCURRENCY, as in .env.example, also means one per core
+    return int(os.getenv("WEB_CONCURRENCY") or 0) or available_cores()
+
+def _installed(module: str):
+    return importlib.util.find_spec(module) is not None
+
+def event_loop_choice():
+    return "uvloop" if _installed("uvloop") else "asyncio"
+
+def http_protocol_choice():
+    return "httptools" if _installed("httptools") else "h11"
+
+class DrainingServer(uvicorn.Server):
+    """Keeps serving for a drain delay after SIGTERM/SIGINT, with /health reporting 503."""
+
+    drain_started = None
+
+    def handle_exit(self, sig, frame):
+        global _draining
+        if self.drain_started is None and SERVER_DRAIN_DELAY_SECONDS > 0:
+            _draining = True
+            self.drain_started = time.monotonic()
+            self._captured_signals.append(sig)
+            logger.info("Draining for %.0fs before shutting down", SERVER_DRAIN_DELAY_SECONDS)
+            return
+        # A second signal skips the rest of the delay, as uvicorn's own second Ctrl+C forces exit
+        super().handle_exit(sig, frame)
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.drain_started is not None and time.monotonic() - self.drain_started >= SERVER_DRAIN_DELAY_SECONDS:
+            self.should_exit = True
+        return await super().on_tick(counter)
+
+def build_config(workers: int):
+    return uvicorn.Config(
+        "app.main:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=workers,
+        loop=event_loop_choice(),
+        http=http_protocol_choice(),
+        lifespan="on",
+        timeout_keep_alive=SERVER_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        log_level=SERVER_LOG_LEVEL,
+        proxy_headers=True,
+    )
+
+def main():
+    from app.db.mongo import ensure_indexes_sync
+
+    workers = worker_count()
+    config = build_config(workers)
+    logging.basicConfig(level=SERVER_LOG_LEVEL.upper())
+    logger.info("Starting %d worker(s) on %s/%s", workers, config.loop, config.http)
+
+    ensure_indexes_sync()
+    # Workers are spawned, so they re-read the environment and skip the index step
+    os.environ["MONGO_ENSURE_INDEXES"] = "false"
+
+    server = DrainingServer(config)
+    if workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+if __name__ == "__main__":
+    # Run the copy imported as app.server, so the workers and /health share one drain flag
+    from app import server
+    server.main()
@@ -0,0 +1,165 @@
+from starlette.concurrency import run_in_threadpool
+from app.db.mongo import db
+from app.utils.upload_utils import UPLOAD_DIR
+from app.utils.metrics import Counter, CollectedMetric
+from bson import json_util
+from datetime import datetime
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+# Events that do not fit in the queue, or that Mongo refused, are appended here and replayed
+# later. Empty drops them instead.
+AUDIT_SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", os.path.join(UPLOAD_DIR, ".audit", "spill.jsonl"))
+AUDIT_REPLAY_INTERVAL_SECONDS = float(os.getenv("AUDIT_REPLAY_INTERVAL_SECONDS", "60"))
+
+audit_events = Counter("audit_events_total", "Audit events by what became of them", ("outcome",))
+
+def _append_lines(path: str, events: list):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # One write per event on an O_APPEND file, so concurrent workers do not interleave lines
+    with open(path, "a") as spill:
+        for event in events:
+            spill.write(json_util.dumps(event) + "\n")
+            spill.flush()
+
+def _claim_spill(path: str):
+    """Move the spill file aside and return its events; whoever renames it first replays it."""
+    claimed = f"{path}.{os.getpid()}.replay"
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return claimed, []
+    with open(claimed) as spill:
+        return claimed, [json_util.loads(line) for line in spill if line.strip()]
+
+class AuditLog:
+    """Write-behind event log: record() never waits on Mongo, a background task batches inserts."""
+
+    def __init__(self, collection, maxsize: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL_SECONDS, spill_path: str = AUDIT_SPILL_PATH):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self._queue = asyncio.Queue(maxsize)
+        # Taken off the queue but not yet written; flush() still writes it if the writer is cancelled
+        self._batch = []
+        self._last_replay = 0.0
+
+    def record(self, event_type: str, actor: str, **fields):
+        event = {"at": datetime.utcnow(), "meta": {"type": event_type, "actor": actor}, **fields}
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflow([event])
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _overflow(self, events: list):
+        if not self.spill_path:
+            audit_events.inc(len(events), outcome="dropped")
+            return
+        try:
+            # Only reached when the writer is behind; small appends are cheaper than a thread hop
+            _append_lines(self.spill_path, events)
+            audit_events.inc(len(events), outcome="spilled")
+        except OSError:
+            logger.exception("Could not spill %d audit events", len(events))
+            audit_events.inc(len(events), outcome="dropped")
+
+    async def _next_batch(self):
+        """Collect up to batch_size events, waiting at most flush_interval after the first one."""
+        self._batch.append(await self._queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self._batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return self._batch
+
+    async def _write(self, batch: list):
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+            audit_events.inc(len(batch), outcome="written")
+            return True
+        except Exception:
+            logger.exception("Could not write %d audit events", len(batch))
+            for event in batch:
+                event.pop("_id", None)
+            await run_in_threadpool(self._overflow, batch)
+            return False
+
+    async def replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        claimed, events = await run_in_threadpool(_claim_spill, self.spill_path)
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                audit_events.inc(len(batch), outcome="replayed")
+            except Exception:
+                logger.exception("Audit spill replay failed; keeping the rest for later")
+                for event in events[start:]:
+                    event.pop("_id", None)
+                await run_in_threadpool(_append_lines, self.spill_path, events[start:])
+                break
+        await run_in_threadpool(os.remove, claimed)
+
+    async def run(self):
+        while True:
+            try:
+                if time.monotonic() - self._last_replay >= AUDIT_REPLAY_INTERVAL_SECONDS:
+                    self._last_replay = time.monotonic()
+                    await self.replay_spill()
+                await self._write(await self._next_batch())
+                self._batch = []
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Audit writer failed")
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        """Write everything still queued, e.g. on shutdown."""
+        batch, self._batch = self._batch, []
+        if batch:
+            await self._write(batch)
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait() for _ in range(min(self.batch_size, self._queue.qsize()))]
+            await self._write(batch)
+
+audit_log = AuditLog(db.audit_events)
+
+CollectedMetric(
+    "audit_queue_depth", "Audit events waiting to be written", "gauge", lambda: [((), audit_log.pending())]
+)
+
+def record_event(event_type: str, actor: str, **fields):
+    audit_log.record(event_type, actor, **fields)
+
+def start_audit_writer():
+    return asyncio.create_task(audit_log.run())
+
+async def stop_audit_writer(task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await audit_log.flush()
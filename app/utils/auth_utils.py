@@ -1,9 +1,15 @@
-from jose import jwt, JWTError, ExpiredSignatureError
+from jose import JWTError, ExpiredSignatureError
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.cache import TTLCache
+from app.utils.token_engine import load_token_engine
+from app.utils.metrics import Histogram, CollectedMetric
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,10 +17,54 @@ load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here-make-it-long-and-random")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "2"))
+JWT_KEYS_FILE = os.getenv("JWT_KEYS_FILE")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+token_engine = load_token_engine(JWT_KEYS_FILE, SECRET_KEY, ALGORITHM)
+# Verified claims keyed by the raw token; entries never outlive the token's exp
+_token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+
+# Pinning min == max == default makes verify_and_update flag any hash at another cost
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_password_jobs = 0
+_password_stats = {
+    "completed": 0,
+    "rejected": 0,
+    "wait_seconds": 0.0,
+    "run_seconds": 0.0,
+}
+
+password_hash_seconds = Histogram(
+    "password_hash_seconds", "bcrypt jobs: time queued for a worker and time spent hashing", ("phase",)
+)
+jwt_decode_seconds = Histogram("jwt_decode_seconds", "Signature checks for tokens not yet in the cache")
+CollectedMetric(
+    "password_hash_jobs", "bcrypt jobs running or queued", "gauge", lambda: [((), _password_jobs)]
+)
+CollectedMetric(
+    "password_hash_rejected_total", "bcrypt jobs refused with 503 because the queue was full", "counter",
+    lambda: [((), _password_stats["rejected"])]
+)
+CollectedMetric(
+    "token_cache_requests_total", "Verified-token cache lookups", "counter",
+    lambda: [(("hit",), _token_cache.hits), (("miss",), _token_cache.misses)], ("result",)
+)
 
 def create_jwt_token(email: str, role: str = "client"):
     expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
@@ -23,7 +73,22 @@ def create_jwt_token(email: str, role: str = "client"):
         "role": role,
         "exp": expire
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    return token_engine.encode(payload)
+
+def encode_token(payload: dict):
+    return token_engine.encode(payload)
+
+def decode_token(token: str):
+    claims = _token_cache.get(token)
+    if claims is None:
+        with jwt_decode_seconds.time():
+            claims = token_engine.decode(token)
+        exp = claims.get("exp")
+        _token_cache.set(token, claims, exp - time.time() if exp else None)
+    return claims
+
+def token_cache_stats():
+    return _token_cache.stats()
 
 def hash_password(password: str):
     return pwd_context.hash(password)
@@ -31,18 +96,71 @@ def hash_password(password: str):
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
-def verify_user_type(token: str = Depends(oauth2_scheme)):
+async def _run_password_job(func, *args):
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE:
+        _password_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+
+    submitted = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        result = func(*args)
+        return result, started - submitted, time.perf_counter() - started
+
+    _password_jobs += 1
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        result, waited, ran = await asyncio.get_running_loop().run_in_executor(_password_executor, job)
+    finally:
+        _password_jobs -= 1
+
+    _password_stats["completed"] += 1
+    _password_stats["wait_seconds"] += waited
+    _password_stats["run_seconds"] += ran
+    password_hash_seconds.observe(waited, phase="wait")
+    password_hash_seconds.observe(ran, phase="run")
+    return result
+
+async def hash_password_async(password: str):
+    return await _run_password_job(pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash should be replaced."""
+    return await _run_password_job(pwd_context.verify_and_update, plain_password, hashed_password)
+
+def password_pool_stats():
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "queue_limit": PASSWORD_HASH_QUEUE_SIZE,
+        "in_flight": min(_password_jobs, PASSWORD_HASH_WORKERS),
+        "queued": max(_password_jobs - PASSWORD_HASH_WORKERS, 0),
+        **_password_stats,
+    }
+
+def shutdown_password_pool():
+    _password_executor.shutdown(wait=False, cancel_futures=True)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    """Return {"email", "role"} for the bearer token."""
+    try:
+        payload = decode_token(token)
         email = payload.get("sub")
         role = payload.get("role", "client")
 
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        return role
+        return {"email": email, "role": role}
 
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+async def verify_user_type(token: str = Depends(oauth2_scheme)):
+    return (await get_current_user(token))["role"]
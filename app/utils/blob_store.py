@@ -0,0 +1,129 @@
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from app.utils.upload_utils import UPLOAD_DIR, MAX_FILE_SIZE, write_stream_atomic, iter_upload_file
+from app.utils.encryption import BlobEncryptor, ciphertext_size, encryption_enabled
+from app.utils.storage import BLOB_DIR, blob_path, get_storage
+from app.utils.download_utils import open_local_source
+from app.utils.stats import record_blobs_changed
+from app.db.mongo import db
+from pymongo import UpdateOne, ReturnDocument
+from collections import Counter, namedtuple
+from datetime import datetime
+from functools import partial
+import hashlib
+import os
+import uuid
+
+INCOMING_DIR = os.path.join(UPLOAD_DIR, ".incoming")
+
+StoredBlob = namedtuple("StoredBlob", ["blob_id", "size", "created", "encrypted"])
+
+def file_path_for(file_meta: dict):
+    """Return the on-disk path of a db.files document, old flat layout included."""
+    if file_meta.get("blob_id"):
+        return blob_path(file_meta["blob_id"])
+    return os.path.join(UPLOAD_DIR, file_meta["filename"])
+
+def source_opener_for(file_meta: dict):
+    """Async callable opening a download source for a db.files document."""
+    if file_meta.get("blob_id"):
+        return partial(get_storage().open, file_meta["blob_id"], file_meta.get("encrypted", False))
+    return partial(open_local_source, file_path_for(file_meta))
+
+def offload_path_for(file_meta: dict):
+    """Path the proxy may serve directly, or None when the bytes are remote or encrypted."""
+    if file_meta.get("encrypted"):
+        return None
+    if file_meta.get("blob_id"):
+        return get_storage().local_path(file_meta["blob_id"])
+    return file_path_for(file_meta)
+
+def presigned_url_for(file_meta: dict):
+    if not file_meta.get("blob_id") or file_meta.get("encrypted"):
+        return None
+    return get_storage().presigned_url(file_meta["blob_id"], file_meta["filename"])
+
+async def store_blob(chunks, max_size: int = None):
+    """Stream chunks into the blob store, hashing them on the way in.
+
+    The blob id is the sha256 of the plaintext. With STORAGE_MASTER_KEY set the bytes are
+    encrypted with a fresh data key as they stream. Content that is already stored is not
+    kept twice: the incoming copy is dropped and the existing blob is reused. The bytes are
+    spooled to local disk first and then handed to the configured storage driver.
+    """
+    max_size = MAX_FILE_SIZE if max_size is None else max_size
+    await run_in_threadpool(os.makedirs, INCOMING_DIR, exist_ok=True)
+    incoming_path = os.path.join(INCOMING_DIR, uuid.uuid4().hex)
+    hasher = hashlib.sha256()
+    encryptor = BlobEncryptor() if encryption_enabled() else None
+    size = 0
+
+    def absorb(chunk: bytes):
+        hasher.update(chunk)
+        return encryptor.update(chunk) if encryptor else chunk
+
+    async def stored_bytes():
+        nonlocal size
+        if encryptor:
+            yield encryptor.header
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=413, detail="File too large")
+            yield await run_in_threadpool(absorb, chunk)
+        if encryptor:
+            yield await run_in_threadpool(encryptor.finalize)
+
+    stored_limit = ciphertext_size(max_size) if encryptor else max_size
+    await write_stream_atomic(stored_bytes(), incoming_path, stored_limit)
+    blob_id = hasher.hexdigest()
+    created, encrypted = await get_storage().commit(incoming_path, blob_id, encryptor is not None)
+    return StoredBlob(blob_id, size, created, encrypted)
+
+async def store_upload_file(file: UploadFile):
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+    return await store_blob(iter_upload_file(file))
+
+async def add_blob_reference(blob_id: str, size: int):
+    result = await db.blobs.update_one(
+        {"_id": blob_id},
+        {
+            "$inc": {"refcount": 1},
+            "$setOnInsert": {"size": size, "created_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        await record_blobs_changed(1, size)
+
+async def add_blob_references(blobs):
+    """Count a reference for each StoredBlob in one round trip."""
+    counts, sizes = Counter(), {}
+    for blob in blobs:
+        # One upsert per blob id: two upserts of a new id in one batch could both try to insert
+        counts[blob.blob_id] += 1
+        sizes[blob.blob_id] = blob.size
+    if not counts:
+        return
+    now = datetime.utcnow()
+    blob_ids = list(counts)
+    result = await db.blobs.bulk_write([
+        UpdateOne(
+            {"_id": blob_id},
+            {"$inc": {"refcount": count}, "$setOnInsert": {"size": sizes[blob_id], "created_at": now}},
+            upsert=True
+        )
+        for blob_id, count in counts.items()
+    ], ordered=False)
+    created = [blob_ids[index] for index in result.upserted_ids]
+    await record_blobs_changed(len(created), sum(sizes[blob_id] for blob_id in created))
+
+async def release_blob_references(blob_ids):
+    """Drop one reference per blob id. The bytes stay until the storage sweeper reclaims them."""
+    for blob_id in blob_ids:
+        blob = await db.blobs.find_one_and_update(
+            {"_id": blob_id}, {"$inc": {"refcount": -1}}, return_document=ReturnDocument.AFTER
+        )
+        if blob is not None and blob["refcount"] == 0:
+            await record_blobs_changed(-1, -blob.get("size", 0))
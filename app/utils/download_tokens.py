@@ -0,0 +1,179 @@
+from fastapi import HTTPException
+from app.db.mongo import db
+from app.utils.auth_utils import encode_token
+from app.utils.metrics import Counter, CollectedMetric
+from datetime import datetime, timedelta
+from pymongo import CursorType, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import heapq
+import logging
+import os
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_TOKEN_EXPIRE_MINUTES = int(os.getenv("DOWNLOAD_TOKEN_EXPIRE_MINUTES", "10"))
+# Most uses a download link may allow, and the default; 0 means links can be used any
+# number of times until they expire
+DOWNLOAD_LINK_MAX_USES = int(os.getenv("DOWNLOAD_LINK_MAX_USES", "0"))
+REVOCATION_SYNC_RETRY_SECONDS = float(os.getenv("REVOCATION_SYNC_RETRY_SECONDS", "1"))
+
+download_link_rejections = Counter(
+    "download_link_rejections_total", "Download links refused after a valid signature", ("reason",)
+)
+
+class RevocationIndex:
+    """In-process set of revoked keys, each dropped once the tokens it can match have expired.
+
+    Keys are a token jti, or "file:<id>" for every link to a file issued before the revocation.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._expiry = []
+
+    def add(self, key: str, revoked_at: float, expires_at: float, reason: str = "revoked"):
+        if expires_at <= time.time():
+            return
+        current = self._entries.get(key)
+        # A revocation replaces a "used" mark, never the other way round
+        if current is None or current[1] < expires_at or (current[2] == "used" and reason != "used"):
+            self._entries[key] = (revoked_at, expires_at, reason)
+            heapq.heappush(self._expiry, (expires_at, key))
+
+    def revoked_reason(self, jti: str, file_id: str, issued_at: float):
+        """Why a link is refused, or None if it is not. "used" only when it is not also revoked."""
+        entry = self._entries.get(jti)
+        if entry is not None and entry[2] != "used":
+            return entry[2]
+        file_entry = self._entries.get(f"file:{file_id}")
+        if file_entry is not None and issued_at <= file_entry[0]:
+            return file_entry[2]
+        return entry[2] if entry is not None else None
+
+    def prune(self, now: float = None):
+        now = time.time() if now is None else now
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= expires_at:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+revocations = RevocationIndex()
+
+REJECTION_DETAILS = {"used": "Download link already used"}
+
+CollectedMetric(
+    "download_link_revocations", "Revoked download links and files held in memory", "gauge",
+    lambda: [((), len(revocations))]
+)
+
+def issue_download_token(file_id: str, user: dict, max_uses: int = DOWNLOAD_LINK_MAX_USES):
+    """Return the signed token and its jti."""
+    now = datetime.utcnow()
+    payload = {
+        "file_id": file_id,
+        # sub lets the download path apply per-user concurrency caps
+        "sub": user["email"],
+        "role": user["role"],
+        "jti": uuid.uuid4().hex,
+        # Sub-second so a file revoked in the same second still catches links issued before it
+        "iat": time.time(),
+        "exp": now + timedelta(minutes=DOWNLOAD_TOKEN_EXPIRE_MINUTES),
+    }
+    if max_uses:
+        payload["max_uses"] = max_uses
+    return encode_token(payload), payload["jti"]
+
+async def _publish(key: str, revoked_at: float, expires_at: float, reason: str):
+    # Local first, so this replica refuses the link even before the log round trip finishes
+    revocations.add(key, revoked_at, expires_at, reason)
+    await db.token_revocations.insert_one({
+        "key": key,
+        "revoked_at": revoked_at,
+        "expires_at": expires_at,
+        "reason": reason,
+    })
+
+async def revoke_download_token(payload: dict):
+    await _publish(payload["jti"], time.time(), float(payload["exp"]), "revoked")
+
+async def revoke_file_links(file_id: str):
+    """Revoke every link to file_id issued so far."""
+    now = time.time()
+    await _publish(f"file:{file_id}", now, now + DOWNLOAD_TOKEN_EXPIRE_MINUTES * 60, "revoked")
+
+async def _consume_use(payload: dict):
+    """Count one use and return the new count, or None once none are left. Atomic across replicas."""
+    try:
+        usage = await db.download_link_uses.find_one_and_update(
+            {"_id": payload["jti"], "uses": {"$lt": payload["max_uses"]}},
+            {
+                "$inc": {"uses": 1},
+                "$setOnInsert": {"expires_at": datetime.utcfromtimestamp(payload["exp"])},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The filter missed because uses == max_uses, and the upsert then hit the existing _id
+        return None
+    return usage["uses"]
+
+def _refuse(reason: str):
+    download_link_rejections.inc(reason=reason)
+    raise HTTPException(status_code=401, detail=REJECTION_DETAILS.get(reason, "Download link revoked"))
+
+def check_download_token(payload: dict):
+    """Refuse revoked links, from the in-memory index only.
+
+    Used-up links are not refused here: they may still resume a download until they expire.
+    """
+    jti = payload.get("jti")
+    if jti is None:
+        # Issued before links had ids; they still expire on schedule
+        return
+    reason = revocations.revoked_reason(jti, payload.get("file_id"), payload.get("iat", 0))
+    if reason is not None and reason != "used":
+        _refuse(reason)
+
+async def consume_download_use(payload: dict):
+    """Spend one use of a limited link, refusing it once none are left. Unlimited links never touch Mongo."""
+    jti = payload.get("jti")
+    if jti is not None and payload.get("max_uses"):
+        if revocations.revoked_reason(jti, payload.get("file_id"), payload.get("iat", 0)) == "used":
+            _refuse("used")
+        uses = await _consume_use(payload)
+        if uses is None:
+            revocations.add(jti, time.time(), float(payload["exp"]), "used")
+            _refuse("used")
+        if uses >= payload["max_uses"]:
+            # Last use: from here on every replica refuses new downloads without asking Mongo
+            await _publish(jti, time.time(), float(payload["exp"]), "used")
+
+async def sync_revocations_forever():
+    """Follow the capped revocation log so links revoked on other replicas are refused here too."""
+    while True:
+        try:
+            cursor = db.token_revocations.find(
+                {"expires_at": {"$gt": time.time()}}, cursor_type=CursorType.TAILABLE_AWAIT
+            )
+            while cursor.alive:
+                async for event in cursor:
+                    revocations.add(event["key"], event["revoked_at"], event["expires_at"], event["reason"])
+                revocations.prune()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Revocation log sync failed")
+        # A tailable cursor on an empty capped collection closes at once; reopen it later
+        revocations.prune()
+        await asyncio.sleep(REVOCATION_SYNC_RETRY_SECONDS)
@@ -0,0 +1,432 @@
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from app.utils.upload_utils import UPLOAD_DIR
+from app.utils.encryption import BlobDecryptor, HEADER as ENCRYPTION_HEADER
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+from functools import partial
+from urllib.parse import quote
+import anyio
+import mimetypes
+import os
+import secrets
+
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+MAX_RANGES = int(os.getenv("DOWNLOAD_MAX_RANGES", "16"))
+DOWNLOAD_FD_CACHE_SIZE = int(os.getenv("DOWNLOAD_FD_CACHE_SIZE", "256"))
+# "nginx" hands the transfer to the proxy with X-Accel-Redirect, "sendfile" with X-Sendfile
+DOWNLOAD_OFFLOAD = os.getenv("DOWNLOAD_OFFLOAD", "")
+DOWNLOAD_OFFLOAD_PREFIX = os.getenv("DOWNLOAD_OFFLOAD_PREFIX", "/protected-uploads/")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def make_etag(sha256: str):
+    return f'"{sha256}"'
+
+def http_date(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def _parse_http_date(value: str):
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def _truncate_to_seconds(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+def _etag_list(header: str):
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+def _weak_match(header: str, etag: str):
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in _etag_list(header):
+        if (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+def _strong_match(header: str, etag: str):
+    if header.strip() == "*":
+        return True
+    if etag.startswith("W/"):
+        return False
+    return etag in _etag_list(header)
+
+def evaluate_preconditions(request: Request, etag: str, last_modified):
+    """Apply RFC 7232 conditional headers, in the order of section 6.
+
+    Returns the status code to short-circuit with (304 or 412), or None to carry on.
+    """
+    headers = request.headers
+    modified = _truncate_to_seconds(last_modified)
+
+    if_match = headers.get("if-match")
+    if if_match is not None:
+        if not _strong_match(if_match, etag):
+            return 412
+    else:
+        since = headers.get("if-unmodified-since")
+        parsed = _parse_http_date(since) if since else None
+        if parsed is not None and modified > parsed:
+            return 412
+
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        if _weak_match(if_none_match, etag):
+            return 304 if request.method in ("GET", "HEAD") else 412
+    elif request.method in ("GET", "HEAD"):
+        since = headers.get("if-modified-since")
+        parsed = _parse_http_date(since) if since else None
+        if parsed is not None and modified <= parsed:
+            return 304
+
+    return None
+
+def _if_range_allows(request: Request, etag: str, last_modified):
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return not etag.startswith("W/") and if_range == etag
+    parsed = _parse_http_date(if_range)
+    return parsed is not None and parsed == _truncate_to_seconds(last_modified)
+
+def select_ranges(request: Request, size: int, etag: str, last_modified):
+    """Ranges a request is served with, or None for the full body. Raises RangeNotSatisfiable."""
+    range_header = request.headers.get("range")
+    if range_header is None or request.method != "GET" or not _if_range_allows(request, etag, last_modified):
+        return None
+    return parse_range_header(range_header, size)
+
+def starts_download(request: Request, size: int, etag: str, last_modified):
+    """Whether the response carries byte 0, i.e. begins a download rather than resuming one."""
+    if request.method != "GET" or evaluate_preconditions(request, etag, last_modified) is not None:
+        return False
+    try:
+        ranges = select_ranges(request, size, etag, last_modified)
+    except RangeNotSatisfiable:
+        return False
+    return not ranges or ranges[0][0] == 0
+
+def parse_range_header(header: str, size: int):
+    """Parse a bytes Range header into sorted, coalesced (start, end) pairs, end inclusive.
+
+    Returns None when the header is malformed or should be ignored, in which case the
+    full representation is served. Raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or not (first.isdigit() or last.isdigit()):
+            return None
+        if first and last and not (first.isdigit() and last.isdigit()):
+            return None
+        if not first:
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                continue
+            end = min(end, size - 1)
+        ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def content_disposition(filename: str):
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+class _OpenFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.users = 0
+        self.evicted = False
+        self.decryptor = None
+
+    def fileno(self):
+        return self.fd
+
+    def close_if_unused(self):
+        if self.evicted and self.users == 0:
+            os.close(self.fd)
+
+class FileHandleCache:
+    """LRU of read-only descriptors for immutable files.
+
+    Reads go through os.pread, which carries its own offset, so one descriptor can back
+    any number of concurrent downloads. Evicted descriptors close once their last reader is done.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._handles = OrderedDict()
+
+    def get(self, path: str):
+        handle = self._handles.get(path)
+        if handle is not None:
+            self._handles.move_to_end(path)
+        return handle
+
+    def put(self, handle: _OpenFile):
+        self._handles[handle.path] = handle
+        while len(self._handles) > self.maxsize:
+            _, evicted = self._handles.popitem(last=False)
+            evicted.evicted = True
+            evicted.close_if_unused()
+
+    def discard(self, path: str):
+        handle = self._handles.pop(path, None)
+        if handle is not None:
+            handle.evicted = True
+            handle.close_if_unused()
+
+    def __len__(self):
+        return len(self._handles)
+
+_handle_cache = FileHandleCache(DOWNLOAD_FD_CACHE_SIZE)
+
+class LocalFileSource:
+    """Byte source for one download, backed by a (possibly shared) open descriptor."""
+
+    def __init__(self, handle: _OpenFile):
+        self.handle = handle
+        handle.users += 1
+
+    @property
+    def file(self):
+        return self.handle
+
+    async def read(self, offset: int, length: int):
+        return await run_in_threadpool(os.pread, self.handle.fd, length, offset)
+
+    def close(self):
+        self.handle.users -= 1
+        self.handle.close_if_unused()
+
+class EncryptedFileSource(LocalFileSource):
+    """Plaintext view of an encrypted blob; only the chunks covering a read are decrypted."""
+
+    file = None
+
+    def _read_plaintext(self, offset: int, length: int):
+        decryptor = self.handle.decryptor
+        first, start, span = decryptor.ciphertext_span(offset, length)
+        return decryptor.decrypt_span(first, os.pread(self.handle.fd, span, start), offset, length)
+
+    async def read(self, offset: int, length: int):
+        return await run_in_threadpool(self._read_plaintext, offset, length)
+
+def _load_decryptor(handle: _OpenFile):
+    header = os.pread(handle.fd, ENCRYPTION_HEADER.size, 0)
+    return BlobDecryptor(header, os.fstat(handle.fd).st_size)
+
+async def open_local_source(path: str, cacheable: bool = False, encrypted: bool = False):
+    """Open path for download, reusing a cached descriptor when the file is immutable.
+
+    Raises FileNotFoundError if the file is gone.
+    """
+    handle = _handle_cache.get(path) if cacheable else None
+    if handle is None:
+        handle = await run_in_threadpool(_OpenFile, path)
+        if cacheable:
+            _handle_cache.put(handle)
+        else:
+            handle.evicted = True
+
+    if not encrypted:
+        return LocalFileSource(handle)
+    if handle.decryptor is None:
+        handle.users += 1
+        try:
+            handle.decryptor = await run_in_threadpool(_load_decryptor, handle)
+        finally:
+            handle.users -= 1
+    return EncryptedFileSource(handle)
+
+def forget_local_source(path: str):
+    _handle_cache.discard(path)
+
+class RangeFileResponse(Response):
+    """Send a list of segments, each either literal bytes or an (offset, length) slice of the source.
+
+    When the ASGI server advertises the ``http.response.zerocopy`` extension, slices are
+    handed to it as (file, offset, count) so it can sendfile() them; otherwise they are
+    pread in chunks off the event loop.
+    """
+
+    def __init__(self, source, segments, status_code: int, headers: dict, media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.source = source
+        self.segments = segments
+
+    async def _send_segments(self, send, zerocopy: bool):
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                await send({"type": "http.response.body", "body": segment, "more_body": True})
+                continue
+
+            offset, remaining = segment
+            if zerocopy and getattr(self.source, "file", None) is not None:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": self.source.file,
+                    "offset": offset,
+                    "count": remaining,
+                    "more_body": True,
+                })
+                continue
+
+            while remaining > 0:
+                chunk = await self.source.read(offset, min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise RuntimeError("File shrank while it was being sent")
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _listen_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+
+            zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+            async with anyio.create_task_group() as task_group:
+                async def wrap(func):
+                    await func()
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(wrap, partial(self._send_segments, send, zerocopy))
+                await wrap(partial(self._listen_for_disconnect, receive))
+        finally:
+            self.source.close()
+
+        if self.background is not None:
+            await self.background()
+
+def _offload_response(path: str, headers: dict, media_type: str):
+    # The proxy re-applies Range itself, so only validators and disposition are passed on
+    if DOWNLOAD_OFFLOAD == "nginx":
+        relative = os.path.relpath(path, UPLOAD_DIR).replace(os.sep, "/")
+        headers["x-accel-redirect"] = DOWNLOAD_OFFLOAD_PREFIX.rstrip("/") + "/" + quote(relative)
+    else:
+        headers["x-sendfile"] = os.path.abspath(path)
+    return Response(status_code=200, headers=headers, media_type=media_type)
+
+async def build_download_response(
+    request: Request,
+    open_source,
+    filename: str,
+    size: int,
+    etag: str,
+    last_modified,
+    offload_path: str = None,
+):
+    """Serve a stored file with validators, conditional GET and single/multi-range support.
+
+    open_source is an async callable returning the byte source; it raises FileNotFoundError
+    if the file is gone. Only files with an offload_path may be handed to the proxy.
+    """
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": http_date(last_modified),
+        "content-disposition": content_disposition(filename),
+    }
+
+    status = evaluate_preconditions(request, etag, last_modified)
+    if status == 304:
+        return Response(status_code=304, headers={k: headers[k] for k in ("etag", "last-modified")})
+    if status == 412:
+        return Response(status_code=412)
+
+    if DOWNLOAD_OFFLOAD and offload_path:
+        return _offload_response(offload_path, headers, media_type)
+
+    try:
+        ranges = select_ranges(request, size, etag, last_modified)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}", "accept-ranges": "bytes"})
+
+    try:
+        source = await open_source()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File missing from server")
+
+    if not ranges:
+        headers["content-length"] = str(size)
+        return RangeFileResponse(source, [(0, size)], 200, headers, media_type)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1)
+        return RangeFileResponse(source, [(start, end - start + 1)], 206, headers, media_type)
+
+    boundary = secrets.token_hex(16)
+    segments = []
+    for index, (start, end) in enumerate(ranges):
+        preamble = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        segments.append(preamble if index == 0 else b"\r\n" + preamble)
+        segments.append((start, end - start + 1))
+    segments.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+
+    headers["content-length"] = str(sum(len(s) if isinstance(s, bytes) else s[1] for s in segments))
+    return RangeFileResponse(source, segments, 206, headers, f"multipart/byteranges; boundary={boundary}")
@@ -0,0 +1,113 @@
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.keywrap import aes_key_wrap, aes_key_unwrap
+import base64
+import os
+import struct
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Base64-encoded 256-bit key. When unset, new blobs are stored in plaintext.
+STORAGE_MASTER_KEY = os.getenv("STORAGE_MASTER_KEY", "")
+ENCRYPTION_CHUNK_SIZE = int(os.getenv("ENCRYPTION_CHUNK_SIZE", str(64 * 1024)))
+
+# Blob layout: header, then every plaintext chunk as AES-GCM ciphertext followed by its 16 byte tag.
+#   magic(4) version(1) chunk_size(4) nonce_prefix(7) wrapped_key(40)
+# Chunk i uses nonce = nonce_prefix || i (4 bytes) || last flag (1 byte), so chunks cannot be
+# reordered, dropped from the end or spliced in from another blob without failing authentication.
+MAGIC = b"SFSE"
+VERSION = 1
+HEADER = struct.Struct(">4sBI7s40s")
+TAG_SIZE = 16
+
+def _load_master_key(value: str):
+    if not value:
+        return None
+    key = base64.b64decode(value)
+    if len(key) != 32:
+        raise ValueError("STORAGE_MASTER_KEY must be a base64-encoded 32 byte key")
+    return key
+
+_master_key = _load_master_key(STORAGE_MASTER_KEY)
+
+def encryption_enabled():
+    return _master_key is not None
+
+def _nonce(prefix: bytes, index: int, last: bool):
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+class BlobEncryptor:
+    """Incrementally encrypts a plaintext stream with a fresh data key."""
+
+    def __init__(self, chunk_size: int = ENCRYPTION_CHUNK_SIZE):
+        data_key = AESGCM.generate_key(bit_length=256)
+        self.chunk_size = chunk_size
+        self.nonce_prefix = os.urandom(7)
+        self._aead = AESGCM(data_key)
+        self._pending = bytearray()
+        self._index = 0
+        self.header = HEADER.pack(MAGIC, VERSION, chunk_size, self.nonce_prefix, aes_key_wrap(_master_key, data_key))
+
+    def _seal(self, chunk: bytes, last: bool):
+        sealed = self._aead.encrypt(_nonce(self.nonce_prefix, self._index, last), chunk, None)
+        self._index += 1
+        return sealed
+
+    def update(self, data: bytes):
+        self._pending += data
+        out = []
+        # Keep at least one byte back: only finalize() knows which chunk is the last one
+        while len(self._pending) > self.chunk_size:
+            out.append(self._seal(bytes(self._pending[:self.chunk_size]), last=False))
+            del self._pending[:self.chunk_size]
+        return b"".join(out)
+
+    def finalize(self):
+        sealed = self._seal(bytes(self._pending), last=True)
+        self._pending.clear()
+        return sealed
+
+def ciphertext_size(plaintext_size: int, chunk_size: int = ENCRYPTION_CHUNK_SIZE):
+    chunks = max(1, -(-plaintext_size // chunk_size))
+    return HEADER.size + plaintext_size + chunks * TAG_SIZE
+
+def is_encrypted_header(data: bytes):
+    return data[:len(MAGIC)] == MAGIC
+
+class BlobDecryptor:
+    """Random-access decryption of a blob, given its header and total on-disk size."""
+
+    def __init__(self, header: bytes, file_size: int):
+        magic, version, chunk_size, nonce_prefix, wrapped_key = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not an encrypted blob")
+        if _master_key is None:
+            raise RuntimeError("Blob is encrypted but STORAGE_MASTER_KEY is not set")
+        self.chunk_size = chunk_size
+        self.nonce_prefix = nonce_prefix
+        self._aead = AESGCM(aes_key_unwrap(_master_key, wrapped_key))
+
+        self.file_size = file_size
+        body = file_size - HEADER.size
+        self.chunk_count = max(1, -(-body // (chunk_size + TAG_SIZE)))
+        self.plaintext_size = body - self.chunk_count * TAG_SIZE
+
+    def ciphertext_span(self, offset: int, length: int):
+        """Map a plaintext byte range onto (first_chunk, file_offset, file_length) to read."""
+        first = offset // self.chunk_size
+        last = min((offset + length - 1) // self.chunk_size, self.chunk_count - 1)
+        start = HEADER.size + first * (self.chunk_size + TAG_SIZE)
+        end = min(HEADER.size + (last + 1) * (self.chunk_size + TAG_SIZE), self.file_size)
+        return first, start, end - start
+
+    def decrypt_span(self, first: int, ciphertext: bytes, offset: int, length: int):
+        """Decrypt whole chunks read via ciphertext_span and cut out the requested plaintext."""
+        sealed_size = self.chunk_size + TAG_SIZE
+        plaintext = []
+        for position in range(0, len(ciphertext), sealed_size):
+            index = first + position // sealed_size
+            nonce = _nonce(self.nonce_prefix, index, index == self.chunk_count - 1)
+            plaintext.append(self._aead.decrypt(nonce, ciphertext[position:position + sealed_size], None))
+        data = b"".join(plaintext)
+        skip = offset - first * self.chunk_size
+        return data[skip:skip + length]
@@ -0,0 +1,100 @@
+from starlette.concurrency import run_in_threadpool
+from app.utils.blob_store import source_opener_for, store_blob, add_blob_reference, release_blob_references
+from app.utils.office_extract import extract_office_document, OfficeDocumentError
+from app.utils.job_queue import register_job_handler, enqueue_job, enqueue_jobs
+from app.utils.metadata_cache import invalidate_file_meta
+from app.db.mongo import db
+from bson import ObjectId
+from pymongo import ReturnDocument
+from datetime import datetime
+import hashlib
+import tempfile
+import zlib
+
+PROCESSING_READ_SIZE = 1024 * 1024
+# Documents up to this size are processed in memory; larger ones spill to a temp file
+PROCESSING_SPOOL_SIZE = 16 * 1024 * 1024
+
+async def enqueue_file_processing(file_id: str):
+    return await enqueue_job("process_file", {"file_id": file_id})
+
+async def enqueue_files_processing(file_ids: list):
+    return await enqueue_jobs("process_file", [{"file_id": file_id} for file_id in file_ids])
+
+def _absorb(spool, hashers, crc, chunk: bytes):
+    spool.write(chunk)
+    for hasher in hashers:
+        hasher.update(chunk)
+    return zlib.crc32(chunk, crc)
+
+async def _spool_file(file_meta: dict, spool):
+    """Copy the stored plaintext into spool and return its checksums."""
+    sha256, md5, crc = hashlib.sha256(), hashlib.md5(), 0
+    source = await source_opener_for(file_meta)()
+    try:
+        offset = 0
+        while True:
+            chunk = await source.read(offset, PROCESSING_READ_SIZE)
+            if not chunk:
+                break
+            crc = await run_in_threadpool(_absorb, spool, (sha256, md5), crc, chunk)
+            offset += len(chunk)
+    finally:
+        source.close()
+    spool.seek(0)
+    return {"sha256": sha256.hexdigest(), "md5": md5.hexdigest(), "crc32": f"{crc:08x}"}
+
+async def _store_thumbnail(data: bytes):
+    async def chunks():
+        yield data
+
+    # Referenced only once the file document points at it; see process_file_job
+    blob = await store_blob(chunks())
+    return {"blob_id": blob.blob_id, "size": blob.size, "encrypted": blob.encrypted}
+
+async def process_file_job(job: dict):
+    """Checksum, extract text and page count, and keep the embedded preview of an uploaded file."""
+    file_id = job["payload"]["file_id"]
+    file_meta = await db.files.find_one({"_id": ObjectId(file_id)}, {"text": 0})
+    if file_meta is None:
+        return {"skipped": "file deleted"}
+
+    with tempfile.SpooledTemporaryFile(max_size=PROCESSING_SPOOL_SIZE) as spool:
+        checksums = await _spool_file(file_meta, spool)
+        if file_meta.get("blob_id") and checksums["sha256"] != file_meta["blob_id"]:
+            raise RuntimeError(f"Stored bytes of {file_id} do not match their sha256")
+
+        update = {"checksums": checksums, "processed_at": datetime.utcnow()}
+        try:
+            details = await run_in_threadpool(extract_office_document, spool, file_meta["file_type"])
+        except OfficeDocumentError as error:
+            # Not retryable: the bytes will not change. Record why and keep the checksums.
+            update["extraction_error"] = str(error)
+        else:
+            update.update(
+                text=details["text"],
+                text_truncated=details["text_truncated"],
+                page_count=details["page_count"],
+            )
+            if details["thumbnail"]:
+                data, media_type = details["thumbnail"]
+                update["thumbnail"] = {**await _store_thumbnail(data), "media_type": media_type}
+
+    previous = await db.files.find_one_and_update(
+        {"_id": file_meta["_id"]}, {"$set": update}, projection={"thumbnail.blob_id": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is None:
+        # Deleted while we worked; an unreferenced thumbnail is left to the storage sweeper
+        return {"skipped": "file deleted"}
+    # Retries and re-runs store the same preview again: count a reference only when it changed
+    old_thumbnail = previous.get("thumbnail", {}).get("blob_id")
+    new_thumbnail = update.get("thumbnail", {}).get("blob_id")
+    if new_thumbnail and new_thumbnail != old_thumbnail:
+        await add_blob_reference(new_thumbnail, update["thumbnail"]["size"])
+    if old_thumbnail and new_thumbnail and old_thumbnail != new_thumbnail:
+        await release_blob_references([old_thumbnail])
+    await invalidate_file_meta(file_id)
+    return {key: update[key] for key in ("page_count", "extraction_error") if key in update}
+
+register_job_handler("process_file", process_file_job)
@@ -0,0 +1,144 @@
+from app.db.mongo import db
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+
+_handlers = {}
+# Set on enqueue so idle workers in this process start at once instead of at the next poll
+_wakeup = asyncio.Event()
+
+def register_job_handler(job_type: str, handler):
+    """handler is an async callable taking the job document; its return value is stored as the result."""
+    _handlers[job_type] = handler
+
+def _new_job(job_type: str, payload: dict, now: datetime):
+    return {
+        "type": job_type,
+        "payload": payload,
+        "status": "queued",
+        "attempts": 0,
+        "run_after": now,
+        "created_at": now,
+    }
+
+async def enqueue_job(job_type: str, payload: dict):
+    result = await db.jobs.insert_one(_new_job(job_type, payload, datetime.utcnow()))
+    _wakeup.set()
+    return str(result.inserted_id)
+
+async def enqueue_jobs(job_type: str, payloads: list):
+    """Queue several jobs with one insert_many; returns their ids in order."""
+    if not payloads:
+        return []
+    now = datetime.utcnow()
+    result = await db.jobs.insert_many([_new_job(job_type, payload, now) for payload in payloads])
+    _wakeup.set()
+    return [str(job_id) for job_id in result.inserted_ids]
+
+async def get_job(job_id: str):
+    try:
+        return await db.jobs.find_one({"_id": ObjectId(job_id)})
+    except (InvalidId, TypeError):
+        return None
+
+async def acquire_lease(name: str, seconds: int):
+    """True for exactly one caller across replicas per lease period."""
+    now = datetime.utcnow()
+    try:
+        await db.leases.find_one_and_update(
+            {"_id": name, "until": {"$lte": now}},
+            {"$set": {"until": now + timedelta(seconds=seconds), "holder": os.getpid()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+async def claim_job():
+    """Atomically take the oldest runnable job, including ones whose worker died mid-run."""
+    now = datetime.utcnow()
+    return await db.jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_after": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lt": now}},
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "started_at": now,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_job(job: dict):
+    # Matching on attempts means a worker whose lease was taken over cannot overwrite the new run
+    owned = {"_id": job["_id"], "status": "running", "attempts": job["attempts"]}
+    handler = _handlers.get(job["type"])
+    try:
+        if handler is None:
+            raise RuntimeError(f"No handler for job type '{job['type']}'")
+        result = await handler(job)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job straight back instead of leaving it until the lease expires
+        await db.jobs.update_one(owned, {
+            "$set": {"status": "queued", "run_after": datetime.utcnow()},
+            "$inc": {"attempts": -1},
+            "$unset": {"lease_expires_at": ""}
+        })
+        raise
+    except Exception as error:
+        logger.exception("Job %s (%s) failed", job["_id"], job["type"])
+        now = datetime.utcnow()
+        if job["attempts"] >= JOB_MAX_ATTEMPTS:
+            update = {"status": "failed", "finished_at": now}
+        else:
+            retry_in = JOB_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+            update = {"status": "queued", "run_after": now + timedelta(seconds=retry_in)}
+        await db.jobs.update_one(owned, {"$set": {**update, "error": str(error)}, "$unset": {"lease_expires_at": ""}})
+        return
+
+    await db.jobs.update_one(owned, {
+        "$set": {"status": "done", "finished_at": datetime.utcnow(), "result": result, "error": None},
+        "$unset": {"lease_expires_at": ""}
+    })
+
+async def run_job_worker():
+    while True:
+        try:
+            _wakeup.clear()
+            job = await claim_job()
+            if job is not None:
+                await run_job(job)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Job worker could not reach the queue")
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), JOB_POLL_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+def start_job_workers(count: int = JOB_WORKERS):
+    return [asyncio.create_task(run_job_worker()) for _ in range(count)]
@@ -0,0 +1,101 @@
+from app.db.mongo import db
+from app.utils.cache import TTLCache
+from app.utils.metrics import CollectedMetric
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+from datetime import datetime
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", "10000"))
+FILE_CACHE_TTL_SECONDS = int(os.getenv("FILE_CACHE_TTL_SECONDS", "60"))
+# "memory" keeps metadata per process; "redis" adds a cache shared by every replica
+FILE_CACHE_BACKEND = os.getenv("FILE_CACHE_BACKEND", "memory")
+FILE_CACHE_URL = os.getenv("FILE_CACHE_URL", "redis://localhost:6379/0")
+
+class RedisCacheBackend:
+    """Shared cache on any client exposing the redis.asyncio get/set/delete API."""
+
+    def __init__(self, client, ttl: int, prefix: str = "file-meta:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        raw = await self.client.get(self.prefix + key)
+        return json_util.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: dict):
+        await self.client.set(self.prefix + key, json_util.dumps(value), ex=self.ttl)
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+def _build_shared_backend():
+    if FILE_CACHE_BACKEND == "memory":
+        return None
+    if FILE_CACHE_BACKEND != "redis":
+        raise ValueError(f"Unknown FILE_CACHE_BACKEND {FILE_CACHE_BACKEND!r}")
+    try:
+        import redis.asyncio as redis
+    except ImportError:
+        raise RuntimeError("FILE_CACHE_BACKEND=redis requires the 'redis' package")
+    return RedisCacheBackend(redis.from_url(FILE_CACHE_URL), FILE_CACHE_TTL_SECONDS)
+
+_local_cache = TTLCache(FILE_CACHE_SIZE, FILE_CACHE_TTL_SECONDS)
+_shared_cache = _build_shared_backend()
+
+CollectedMetric(
+    "file_metadata_cache_requests_total", "In-process file metadata cache lookups", "counter",
+    lambda: [(("hit",), _local_cache.hits), (("miss",), _local_cache.misses)], ("result",)
+)
+
+def set_shared_backend(backend):
+    """Swap the shared tier, e.g. for a fakeredis client in tests. None disables it."""
+    global _shared_cache
+    _shared_cache = backend
+    _local_cache.clear()
+
+def _live(meta: dict):
+    # The TTL monitor only runs once a minute, and cached copies outlive the document
+    expires_at = meta.get("expires_at")
+    return meta if expires_at is None or expires_at > datetime.utcnow() else None
+
+async def get_file_meta(file_id: str):
+    """Return the db.files document for file_id, or None if the id is unknown, malformed or expired."""
+    meta = _local_cache.get(file_id)
+    if meta is not None:
+        return _live(meta)
+
+    if _shared_cache is not None:
+        meta = await _shared_cache.get(file_id)
+        if meta is not None:
+            _local_cache.set(file_id, meta)
+            return _live(meta)
+
+    try:
+        object_id = ObjectId(file_id)
+    except (InvalidId, TypeError):
+        return None
+    # Extracted text can be large and no reader of this cache needs it
+    meta = await db.files.find_one({"_id": object_id}, {"text": 0})
+    if meta is not None:
+        await cache_file_meta(meta)
+        return _live(meta)
+    return meta
+
+async def cache_file_meta(meta: dict):
+    file_id = str(meta["_id"])
+    _local_cache.set(file_id, meta)
+    if _shared_cache is not None:
+        await _shared_cache.set(file_id, meta)
+
+async def invalidate_file_meta(file_id: str):
+    _local_cache.pop(file_id)
+    if _shared_cache is not None:
+        await _shared_cache.delete(file_id)
+
+def metadata_cache_stats():
+    return {"backend": FILE_CACHE_BACKEND, **_local_cache.stats()}
@@ -0,0 +1,251 @@
+from contextlib import contextmanager
+from pymongo import monitoring
+import asyncio
+import bisect
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# Seconds; wide enough for a cached-token check at the low end and a large upload at the top
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            snapshot = [(key, list(series[0]), series[1], series[2]) for key, series in self._values.items()]
+        samples = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key + (_format_value(bound),), cumulative))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, count))
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self._samples():
+            names = self.labelnames + ("le",) if name.endswith("_bucket") else self.labelnames
+            lines.append(f"{name}{_format_labels(names, key)} {_format_value(value)}")
+        return lines
+
+class CollectedMetric(_Metric):
+    """Metric whose samples are read from a callback at scrape time, for stats kept elsewhere.
+
+    The callback returns an iterable of (label values tuple, value).
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, collect, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def _samples(self):
+        return [(self.name, tuple(str(v) for v in key), value) for key, value in self.collect()]
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "Requests currently being handled"
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last body byte",
+    ("method", "route", "status")
+)
+http_request_body_bytes = Counter(
+    "http_request_body_bytes_total", "Request body bytes received", ("route",)
+)
+http_response_body_bytes = Counter(
+    "http_response_body_bytes_total", "Response body bytes sent, including zero-copy transfers", ("route",)
+)
+mongo_command_duration_seconds = Histogram(
+    "mongo_command_duration_seconds", "Round trip of MongoDB commands", ("command", "collection", "outcome")
+)
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke a periodic timer; sustained lag means something blocks the loop",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+def _route_label(scope):
+    # FastAPI records the matched route, so labels use the template and not the raw path
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, body bytes and in-flight requests per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        received = sent = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal sent, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopy":
+                sent += message.get("count", 0)
+            await send(message)
+
+        http_requests_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            http_requests_in_progress.dec()
+            route = _route_label(scope)
+            http_request_duration_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], route=route, status=status
+            )
+            if received:
+                http_request_body_bytes.inc(received, route=route)
+            if sent:
+                http_response_body_bytes.inc(sent, route=route)
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Feeds every driver command into mongo_command_duration_seconds."""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        # Most commands name their collection in the first field; getMore carries it separately
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome):
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration_seconds.observe(
+            event.duration_micros / 1e6, command=event.command_name, collection=collection, outcome=outcome
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+async def monitor_event_loop_lag(interval: float = METRICS_LOOP_LAG_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(max(loop.time() - expected, 0.0))
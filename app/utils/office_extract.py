@@ -0,0 +1,121 @@
+from xml.etree import ElementTree
+import os
+import re
+import zipfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EXTRACTED_TEXT_MAX_CHARS = int(os.getenv("EXTRACTED_TEXT_MAX_CHARS", str(512 * 1024)))
+# Cap on the decompressed size of any one part we parse; protects against zip bombs
+OFFICE_PART_MAX_BYTES = int(os.getenv("OFFICE_PART_MAX_BYTES", str(64 * 1024 * 1024)))
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+S_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+EP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}"
+
+THUMBNAIL_TYPES = {
+    ".jpeg": "image/jpeg",
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+}
+
+class OfficeDocumentError(Exception):
+    pass
+
+def _open_part(archive: zipfile.ZipFile, name: str):
+    info = archive.getinfo(name)
+    if info.file_size > OFFICE_PART_MAX_BYTES:
+        raise OfficeDocumentError(f"{name} is too large to index")
+    return archive.open(info)
+
+def _iter_text(archive: zipfile.ZipFile, name: str, text_tag: str, break_tag: str):
+    """Yield the text runs of one XML part, with a newline after each paragraph/row."""
+    with _open_part(archive, name) as part:
+        for _, element in ElementTree.iterparse(part):
+            if element.tag == text_tag and element.text:
+                yield element.text
+            elif element.tag == break_tag:
+                yield "\n"
+                element.clear()
+
+def _app_property(archive: zipfile.ZipFile, name: str):
+    try:
+        with _open_part(archive, "docProps/app.xml") as part:
+            value = ElementTree.parse(part).getroot().findtext(EP_NS + name)
+    except KeyError:
+        return None
+    return int(value) if value and value.isdigit() else None
+
+def _slide_number(name: str):
+    return int(re.search(r"(\d+)\.xml$", name).group(1))
+
+def _docx(archive: zipfile.ZipFile):
+    runs = _iter_text(archive, "word/document.xml", W_NS + "t", W_NS + "p")
+    # Word stores the page count it last rendered; there is no layout engine here to recount
+    return runs, _app_property(archive, "Pages")
+
+def _pptx(archive: zipfile.ZipFile):
+    slides = sorted(
+        (name for name in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", name)),
+        key=_slide_number
+    )
+
+    def runs():
+        for slide in slides:
+            yield from _iter_text(archive, slide, A_NS + "t", A_NS + "p")
+
+    return runs(), len(slides)
+
+def _xlsx(archive: zipfile.ZipFile):
+    sheets = [name for name in archive.namelist() if re.fullmatch(r"xl/worksheets/sheet\d+\.xml", name)]
+
+    def runs():
+        # Cell text lives in the shared string table; inline strings are rare enough to skip
+        if "xl/sharedStrings.xml" in archive.namelist():
+            yield from _iter_text(archive, "xl/sharedStrings.xml", S_NS + "t", S_NS + "si")
+
+    return runs(), len(sheets)
+
+EXTRACTORS = {"docx": _docx, "pptx": _pptx, "xlsx": _xlsx}
+
+def _thumbnail(archive: zipfile.ZipFile):
+    for name in archive.namelist():
+        stem, ext = os.path.splitext(name)
+        if stem == "docProps/thumbnail" and ext.lower() in THUMBNAIL_TYPES:
+            with _open_part(archive, name) as part:
+                return part.read(), THUMBNAIL_TYPES[ext.lower()]
+    return None
+
+def extract_office_document(fileobj, file_type: str):
+    """Pull text, a page/slide/sheet count and the embedded thumbnail out of an OOXML file.
+
+    Returns a dict with text, text_truncated, page_count and thumbnail ((bytes, media type)
+    or None). Raises OfficeDocumentError if the file is not a readable document of that type.
+    """
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
+        raise OfficeDocumentError(f"Unsupported file type: {file_type}")
+
+    try:
+        with zipfile.ZipFile(fileobj) as archive:
+            runs, page_count = extractor(archive)
+            pieces, length, truncated = [], 0, False
+            for run in runs:
+                pieces.append(run)
+                length += len(run)
+                if length >= EXTRACTED_TEXT_MAX_CHARS:
+                    truncated = True
+                    break
+            thumbnail = _thumbnail(archive)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as error:
+        raise OfficeDocumentError(f"Not a valid {file_type} document: {error}")
+
+    text = re.sub(r"\n{2,}", "\n", "".join(pieces))[:EXTRACTED_TEXT_MAX_CHARS].strip()
+    return {
+        "text": text,
+        "text_truncated": truncated,
+        "page_count": page_count,
+        "thumbnail": thumbnail,
+    }
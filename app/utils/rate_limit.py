@@ -0,0 +1,243 @@
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from app.utils.auth_utils import decode_token
+from app.utils.metrics import Counter, CollectedMetric
+from collections import OrderedDict
+import math
+import os
+import re
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "memory" limits each process on its own; "redis" shares the buckets between replicas
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", "redis://localhost:6379/1")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Only enable behind a proxy that overwrites X-Forwarded-For, or clients can pick their own key
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+AUTH_IP_RATE_PER_MINUTE = float(os.getenv("AUTH_IP_RATE_PER_MINUTE", "30"))
+AUTH_IP_BURST = int(os.getenv("AUTH_IP_BURST", "10"))
+AUTH_ACCOUNT_RATE_PER_MINUTE = float(os.getenv("AUTH_ACCOUNT_RATE_PER_MINUTE", "10"))
+AUTH_ACCOUNT_BURST = int(os.getenv("AUTH_ACCOUNT_BURST", "5"))
+
+UPLOAD_CONCURRENCY_GLOBAL = int(os.getenv("UPLOAD_CONCURRENCY_GLOBAL", "16"))
+UPLOAD_CONCURRENCY_PER_USER = int(os.getenv("UPLOAD_CONCURRENCY_PER_USER", "4"))
+DOWNLOAD_CONCURRENCY_GLOBAL = int(os.getenv("DOWNLOAD_CONCURRENCY_GLOBAL", "512"))
+DOWNLOAD_CONCURRENCY_PER_USER = int(os.getenv("DOWNLOAD_CONCURRENCY_PER_USER", "8"))
+
+rate_limited_requests = Counter(
+    "rate_limited_requests_total", "Requests refused by a rate limit or concurrency cap", ("limit",)
+)
+
+class MemoryBucketStore:
+    """Token buckets in this process, bounded to the most recently used keys."""
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, capacity: int):
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+# Runs atomically on the server, timed by the server clock so replicas need not agree on time
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+class RedisBucketStore:
+    """Token buckets shared by every replica, on any client exposing the redis.asyncio eval API."""
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def take(self, key: str, rate: float, capacity: int):
+        result = await self.client.eval(_TAKE_SCRIPT, 1, self.prefix + key, rate, capacity)
+        return float(result)
+
+def _build_bucket_store():
+    if RATE_LIMIT_BACKEND != "redis":
+        return MemoryBucketStore()
+    try:
+        import redis.asyncio as redis
+    except ImportError:
+        raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+    return RedisBucketStore(redis.from_url(RATE_LIMIT_URL))
+
+_bucket_store = _build_bucket_store()
+
+def set_bucket_store(store):
+    """Swap the bucket store, e.g. for a fresh in-memory one in tests."""
+    global _bucket_store
+    _bucket_store = store
+
+class TokenBucket:
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.rate = per_minute / 60
+        self.capacity = burst
+
+    async def take(self, key: str):
+        """Return 0 if the request may proceed, else the seconds until a token is available."""
+        return await _bucket_store.take(f"{self.name}:{key}", self.rate, self.capacity)
+
+auth_ip_bucket = TokenBucket("auth-ip", AUTH_IP_RATE_PER_MINUTE, AUTH_IP_BURST)
+auth_account_bucket = TokenBucket("auth-account", AUTH_ACCOUNT_RATE_PER_MINUTE, AUTH_ACCOUNT_BURST)
+
+def client_ip(request_or_scope):
+    scope = request_or_scope.scope if isinstance(request_or_scope, Request) else request_or_scope
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+async def enforce_auth_rate_limit(request: Request, account: str):
+    """Throttle password checks per client IP and per account before any bcrypt work is queued."""
+    checks = [(auth_ip_bucket, client_ip(request))]
+    if account:
+        checks.append((auth_account_bucket, account.strip().lower()))
+
+    for bucket, key in checks:
+        retry_after = await bucket.take(key)
+        if retry_after > 0:
+            rate_limited_requests.inc(limit=bucket.name)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, please retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+class ConcurrencyLimiter:
+    """Caps requests in flight in this process, overall and per user."""
+
+    def __init__(self, name: str, global_limit: int, per_user_limit: int, retry_after: int):
+        self.name = name
+        self.global_limit = global_limit
+        self.per_user_limit = per_user_limit
+        self.retry_after = retry_after
+        self.active = 0
+        self._per_user = {}
+
+    def try_acquire(self, user: str):
+        """Return None when a slot was taken, else the (status, detail) to refuse with."""
+        if self.active >= self.global_limit:
+            return 503, "Server busy, please retry"
+        if self._per_user.get(user, 0) >= self.per_user_limit:
+            return 429, "Too many concurrent requests"
+        self.active += 1
+        self._per_user[user] = self._per_user.get(user, 0) + 1
+        return None
+
+    def release(self, user: str):
+        self.active -= 1
+        remaining = self._per_user[user] - 1
+        if remaining:
+            self._per_user[user] = remaining
+        else:
+            del self._per_user[user]
+
+upload_limiter = ConcurrencyLimiter("upload", UPLOAD_CONCURRENCY_GLOBAL, UPLOAD_CONCURRENCY_PER_USER, 5)
+download_limiter = ConcurrencyLimiter("download", DOWNLOAD_CONCURRENCY_GLOBAL, DOWNLOAD_CONCURRENCY_PER_USER, 2)
+
+CollectedMetric(
+    "concurrency_limiter_active", "Requests holding a concurrency slot", "gauge",
+    lambda: [((limiter.name,), limiter.active) for limiter in (upload_limiter, download_limiter)], ("limiter",)
+)
+
+def _bearer_token(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token if scheme.lower() == "bearer" else None
+    return None
+
+def _path_token(scope):
+    return scope["path"].rstrip("/").rsplit("/", 1)[-1]
+
+# (methods, path pattern, limiter, where the caller's token is)
+CONCURRENCY_RULES = [
+    ({"POST"}, re.compile(r"^/file/upload(/batch)?$"), upload_limiter, _bearer_token),
+    ({"PUT"}, re.compile(r"^/file/uploads/[^/]+/parts/\d+$"), upload_limiter, _bearer_token),
+    ({"GET"}, re.compile(r"^/file/actual-download/(bulk/)?[^/]+$"), download_limiter, _path_token),
+]
+
+class ConcurrencyLimitMiddleware:
+    """Holds a slot for the whole exchange, from before the body is read to the last byte sent.
+
+    Route dependencies only run once FastAPI has read the whole upload, and a download
+    keeps streaming after its handler returns, so the caps have to live at the ASGI layer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _user(self, scope, token):
+        if token:
+            try:
+                subject = decode_token(token).get("sub")
+            except Exception:
+                subject = None
+            if subject:
+                return f"user:{subject}"
+        # Invalid or anonymous callers share a slot pool per address; the route will reject them
+        return f"ip:{client_ip(scope)}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        for methods, pattern, limiter, find_token in CONCURRENCY_RULES:
+            if scope["method"] in methods and pattern.match(scope["path"]):
+                break
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        user = self._user(scope, find_token(scope))
+        refused = limiter.try_acquire(user)
+        if refused is not None:
+            status, detail = refused
+            rate_limited_requests.inc(limit=f"{limiter.name}-concurrency")
+            response = JSONResponse(
+                {"detail": detail}, status_code=status, headers={"Retry-After": str(limiter.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(user)
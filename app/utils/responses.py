@@ -0,0 +1,55 @@
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from bson import ObjectId
+from datetime import datetime
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are only offered when msgpack is installed
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class ORJSONResponse(JSONResponse):
+    """JSON straight from dicts of str/int/datetime/ObjectId, without the jsonable_encoder pass.
+
+    Naive datetimes come out in the same isoformat FastAPI's encoder produces.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+def _msgpack_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        # Same text as the JSON responses; msgpack timestamps cannot carry naive datetimes
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not MessagePack serializable")
+
+class MsgpackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content) -> bytes:
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+def dumps_line(content) -> bytes:
+    """One NDJSON record."""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_APPEND_NEWLINE)
+
+def wants_msgpack(request: Request):
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+def negotiated_response(request: Request, content, status_code: int = 200):
+    """MessagePack when the client asks for it and it is available, JSON otherwise."""
+    response_class = MsgpackResponse if wants_msgpack(request) else ORJSONResponse
+    response = response_class(content, status_code=status_code)
+    response.headers["vary"] = "Accept"
+    return response
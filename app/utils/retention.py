@@ -0,0 +1,235 @@
+from starlette.concurrency import run_in_threadpool
+from app.db.mongo import db
+from app.utils.upload_utils import UPLOAD_DIR
+from app.utils.storage import BLOB_DIR, LocalStorage, blob_path, get_storage
+from app.utils.download_utils import forget_local_source
+from app.utils.download_tokens import revoke_file_links
+from app.utils.blob_store import release_blob_references
+from app.utils.metadata_cache import invalidate_file_meta
+from app.utils.job_queue import acquire_lease
+from app.utils.stats import record_blobs_changed, record_files_removed
+from app.utils.audit import record_event
+from app.utils.metrics import Counter
+from collections import Counter as Tally
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import socket
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Default lifetime of uploaded files; 0 keeps them until deleted. Uploads can set their own.
+FILE_RETENTION_DAYS = int(os.getenv("FILE_RETENTION_DAYS", "0"))
+FILE_EXPIRY_INTERVAL_SECONDS = int(os.getenv("FILE_EXPIRY_INTERVAL_SECONDS", "60"))
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "3600"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "200"))
+# Pause between batches, so a pass over a large store is spread out instead of one burst of I/O
+SWEEP_BATCH_PAUSE_SECONDS = float(os.getenv("SWEEP_BATCH_PAUSE_SECONDS", "0.5"))
+# Unreferenced bytes younger than this may belong to an upload whose metadata is not saved yet
+SWEEP_GRACE_SECONDS = int(os.getenv("SWEEP_GRACE_SECONDS", "3600"))
+
+storage_sweep_reclaimed = Counter(
+    "storage_sweep_reclaimed_total", "Orphaned files removed by the storage sweeper", ("kind",)
+)
+storage_sweep_reclaimed_bytes = Counter(
+    "storage_sweep_reclaimed_bytes_total", "Bytes freed by the storage sweeper", ("kind",)
+)
+
+def expiry_for(expires_in_days: int = None):
+    days = FILE_RETENTION_DAYS if expires_in_days is None else expires_in_days
+    return datetime.utcnow() + timedelta(days=days) if days else None
+
+def unexpired(now: datetime = None):
+    """Filter for files that have no expiry or have not reached it yet."""
+    return {"$not": {"$lte": now or datetime.utcnow()}}
+
+async def remove_file(query: dict, actor: str, event_type: str = "file_deleted", **fields):
+    """Delete one file document and let go of what it held. Returns the document, or None if nothing matched.
+
+    Links are revoked, blob references released, stats decremented and the removal audited.
+    The bytes stay until the storage sweeper finds nothing else references them.
+    """
+    file_meta = await db.files.find_one_and_delete(query, {"text": 0})
+    if file_meta is None:
+        return None
+    file_id = str(file_meta["_id"])
+    await invalidate_file_meta(file_id)
+    await revoke_file_links(file_id)
+    blob_ids = [blob_id for blob_id in (file_meta.get("blob_id"), file_meta.get("thumbnail", {}).get("blob_id")) if blob_id]
+    await release_blob_references(blob_ids)
+    await record_files_removed([file_meta])
+    record_event(event_type, actor, file_id=file_id, filename=file_meta["filename"], **fields)
+    return file_meta
+
+async def expire_files():
+    """Remove files past their expires_at, in rate-limited batches. Returns how many were removed."""
+    removed = 0
+    while True:
+        now = datetime.utcnow()
+        expired = await db.files.find({"expires_at": {"$lte": now}}, {"_id": 1}).limit(SWEEP_BATCH_SIZE).to_list(SWEEP_BATCH_SIZE)
+        for file_meta in expired:
+            # Matching on expires_at again leaves files whose expiry was just extended
+            if await remove_file({"_id": file_meta["_id"], "expires_at": {"$lte": now}}, "system", "file_expired"):
+                removed += 1
+        if len(expired) < SWEEP_BATCH_SIZE:
+            return removed
+        await asyncio.sleep(SWEEP_BATCH_PAUSE_SECONDS)
+
+async def expire_files_forever():
+    """Remove expired files every FILE_EXPIRY_INTERVAL_SECONDS, on one worker at a time."""
+    while True:
+        try:
+            if await acquire_lease("file-expiry", FILE_EXPIRY_INTERVAL_SECONDS):
+                await expire_files()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("File expiry failed")
+        await asyncio.sleep(FILE_EXPIRY_INTERVAL_SECONDS)
+
+def _list_dirs(path: str):
+    try:
+        return sorted(entry.name for entry in os.scandir(path) if entry.is_dir() and not entry.name.startswith("."))
+    except FileNotFoundError:
+        return []
+
+def _list_files(path: str):
+    """(name, mtime, size) of the regular files directly in path, skipping dot files."""
+    try:
+        entries = [entry for entry in os.scandir(path) if entry.is_file(follow_symlinks=False)]
+    except FileNotFoundError:
+        return []
+    listed = []
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        listed.append((entry.name, stat.st_mtime, stat.st_size))
+    return sorted(listed)
+
+def _remove_if_stale(path: str, cutoff: float):
+    """Remove path unless it was written or reused since cutoff. Returns whether it was removed."""
+    try:
+        if os.stat(path).st_mtime > cutoff:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+async def _reference_counts(blob_ids: list):
+    counts = Tally()
+    for field in ("blob_id", "thumbnail.blob_id"):
+        async for group in db.files.aggregate([
+            {"$match": {field: {"$in": blob_ids}}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}
+        ]):
+            counts[group["_id"]] += group["count"]
+    return counts
+
+async def sweep_blob_batch(entries: list, cutoff: float):
+    """Reconcile stored blobs against db.files: reclaim stale unreferenced ones, repair lost refcounts."""
+    blob_ids = [name for name, _, _ in entries]
+    references = await _reference_counts(blob_ids)
+    records = {blob["_id"]: blob async for blob in db.blobs.find({"_id": {"$in": blob_ids}})}
+    reclaimed = 0
+    for blob_id, mtime, size in entries:
+        record = records.get(blob_id)
+        if references[blob_id]:
+            if record is None or record.get("refcount", 0) <= 0:
+                # Compare-and-set, so a reference added meanwhile is not overwritten
+                result = await db.blobs.update_one(
+                    {"_id": blob_id, "refcount": record.get("refcount") if record else {"$exists": False}},
+                    {"$set": {"refcount": references[blob_id]}, "$setOnInsert": {"size": size, "created_at": datetime.utcnow()}},
+                    upsert=record is None
+                )
+                if result.modified_count or result.upserted_id is not None:
+                    await record_blobs_changed(1, record.get("size", size) if record else size)
+            continue
+        if mtime > cutoff:
+            continue
+        path = blob_path(blob_id)
+        forget_local_source(path)
+        if not await run_in_threadpool(_remove_if_stale, path, cutoff):
+            continue
+        record = await db.blobs.find_one_and_delete({"_id": blob_id})
+        if record is not None and record.get("refcount", 0) > 0:
+            # Its files were deleted without releasing it, e.g. by the expiry TTL backstop
+            await record_blobs_changed(-1, -record.get("size", size))
+        storage_sweep_reclaimed.inc(kind="blob")
+        storage_sweep_reclaimed_bytes.inc(size, kind="blob")
+        reclaimed += 1
+    return reclaimed
+
+async def sweep_legacy_batch(entries: list, cutoff: float):
+    """Files in the old flat layout under uploads/ that no db.files document points at."""
+    names = [name for name, _, _ in entries]
+    referenced = set(await db.files.distinct("filename", {"filename": {"$in": names}, "blob_id": {"$exists": False}}))
+    reclaimed = 0
+    for name, mtime, size in entries:
+        if name in referenced or mtime > cutoff:
+            continue
+        path = os.path.join(UPLOAD_DIR, name)
+        forget_local_source(path)
+        if await run_in_threadpool(_remove_if_stale, path, cutoff):
+            storage_sweep_reclaimed.inc(kind="legacy")
+            storage_sweep_reclaimed_bytes.inc(size, kind="legacy")
+            reclaimed += 1
+    return reclaimed
+
+def _batches(entries: list):
+    for start in range(0, len(entries), SWEEP_BATCH_SIZE):
+        yield entries[start:start + SWEEP_BATCH_SIZE]
+
+async def sweep_storage(lease: str = None):
+    """One pass over local storage, a fan-out directory at a time.
+
+    The last finished directory is saved on the lease document, so a pass cut short by a
+    restart resumes where it stopped rather than starting over.
+    """
+    state = await db.leases.find_one({"_id": lease}) if lease else None
+    position = (state or {}).get("position", "")
+    cutoff = time.time() - SWEEP_GRACE_SECONDS
+    reclaimed = 0
+
+    for outer in await run_in_threadpool(_list_dirs, BLOB_DIR):
+        for inner in await run_in_threadpool(_list_dirs, os.path.join(BLOB_DIR, outer)):
+            directory = f"{outer}/{inner}"
+            if directory <= position:
+                continue
+            entries = await run_in_threadpool(_list_files, os.path.join(BLOB_DIR, outer, inner))
+            for batch in _batches(entries):
+                reclaimed += await sweep_blob_batch(batch, cutoff)
+                await asyncio.sleep(SWEEP_BATCH_PAUSE_SECONDS)
+            if lease:
+                await db.leases.update_one({"_id": lease}, {"$set": {"position": directory}})
+
+    # Top-level files only: blobs/ and the dot directories (.incoming, .sessions, .audit) are not files
+    for batch in _batches(await run_in_threadpool(_list_files, UPLOAD_DIR)):
+        reclaimed += await sweep_legacy_batch(batch, cutoff)
+        await asyncio.sleep(SWEEP_BATCH_PAUSE_SECONDS)
+    if lease:
+        await db.leases.update_one({"_id": lease}, {"$set": {"position": "", "last_pass_at": datetime.utcnow()}})
+    return reclaimed
+
+async def sweep_storage_forever():
+    """Sweep this node's disk every SWEEP_INTERVAL_SECONDS, on one worker per host."""
+    if not isinstance(get_storage(), LocalStorage):
+        return
+    # Per host: with local storage every node has its own disk to sweep
+    lease = f"storage-sweep:{socket.gethostname()}"
+    while True:
+        try:
+            if await acquire_lease(lease, SWEEP_INTERVAL_SECONDS):
+                reclaimed = await sweep_storage(lease)
+                logger.info("Storage sweep reclaimed %d orphaned files", reclaimed)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Storage sweep failed")
+        await asyncio.sleep(min(SWEEP_INTERVAL_SECONDS, 60))
@@ -0,0 +1,165 @@
+from app.db.mongo import db
+from app.utils.job_queue import register_job_handler, enqueue_job, acquire_lease
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import random
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Totals are spread over this many documents so concurrent uploads do not all contend on one
+STATS_COUNTER_SHARDS = int(os.getenv("STATS_COUNTER_SHARDS", "8"))
+STATS_ROLLUP_INTERVAL_SECONDS = int(os.getenv("STATS_ROLLUP_INTERVAL_SECONDS", "900"))
+STATS_ROLLUP_BACKFILL_DAYS = int(os.getenv("STATS_ROLLUP_BACKFILL_DAYS", "30"))
+STATS_RECONCILE_INTERVAL_SECONDS = int(os.getenv("STATS_RECONCILE_INTERVAL_SECONDS", str(24 * 3600)))
+
+SHARD_IDS = [f"totals:{shard}" for shard in range(STATS_COUNTER_SHARDS)]
+COUNTER_FIELDS = ("files", "bytes", "blobs", "blob_bytes")
+
+def _file_increments(file_metas, sign: int):
+    increments = {}
+    for file_meta in file_metas:
+        size = file_meta.get("size") or 0
+        file_type = file_meta.get("file_type", "unknown")
+        for field, amount in (
+            ("files", 1), ("bytes", size), (f"by_type.{file_type}.files", 1), (f"by_type.{file_type}.bytes", size)
+        ):
+            increments[field] = increments.get(field, 0) + sign * amount
+    return increments
+
+async def _apply(increments: dict):
+    if increments:
+        await db.storage_stats.update_one(
+            {"_id": random.choice(SHARD_IDS)},
+            {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+async def record_files_added(file_metas):
+    await _apply(_file_increments(file_metas, 1))
+
+async def record_files_removed(file_metas):
+    await _apply(_file_increments(file_metas, -1))
+
+async def record_blobs_changed(count: int, size: int):
+    """Count blobs newly stored (positive) or reclaimed (negative)."""
+    if count:
+        await _apply({"blobs": count, "blob_bytes": size})
+
+async def read_totals():
+    """Sum the counter shards: one indexed read of STATS_COUNTER_SHARDS documents, whatever the file count."""
+    totals = {field: 0 for field in COUNTER_FIELDS}
+    by_type = {}
+    updated_at = None
+    async for shard in db.storage_stats.find({"_id": {"$in": SHARD_IDS}}):
+        for field in COUNTER_FIELDS:
+            totals[field] += shard.get(field, 0)
+        for file_type, counts in shard.get("by_type", {}).items():
+            entry = by_type.setdefault(file_type, {"files": 0, "bytes": 0})
+            entry["files"] += counts.get("files", 0)
+            entry["bytes"] += counts.get("bytes", 0)
+        if shard.get("updated_at") and (updated_at is None or shard["updated_at"] > updated_at):
+            updated_at = shard["updated_at"]
+    # Types whose last file was deleted keep a zeroed entry in the shards
+    totals["by_type"] = {file_type: counts for file_type, counts in by_type.items() if counts["files"]}
+    totals["updated_at"] = updated_at
+    return totals
+
+async def _count_truth():
+    truth = {field: 0 for field in COUNTER_FIELDS}
+    truth["by_type"] = {}
+    async for group in db.files.aggregate([
+        {"$group": {"_id": "$file_type", "files": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$size", 0]}}}}
+    ]):
+        truth["by_type"][group["_id"] or "unknown"] = {"files": group["files"], "bytes": group["bytes"]}
+        truth["files"] += group["files"]
+        truth["bytes"] += group["bytes"]
+    async for group in db.blobs.aggregate([
+        {"$match": {"refcount": {"$gt": 0}}},
+        {"$group": {"_id": None, "blobs": {"$sum": 1}, "blob_bytes": {"$sum": "$size"}}}
+    ]):
+        truth["blobs"], truth["blob_bytes"] = group["blobs"], group["blob_bytes"]
+    return truth
+
+async def reconcile_stats_job(job: dict):
+    """Recount from db.files and db.blobs and $inc the difference into one shard.
+
+    Applying a delta rather than overwriting keeps increments that land during the
+    recount; only an upload racing the two reads can leave a small drift for next time.
+    """
+    truth = await _count_truth()
+    current = await read_totals()
+    drift = {field: truth[field] - current[field] for field in COUNTER_FIELDS if truth[field] != current[field]}
+    for file_type in set(truth["by_type"]) | set(current["by_type"]):
+        want = truth["by_type"].get(file_type, {"files": 0, "bytes": 0})
+        have = current["by_type"].get(file_type, {"files": 0, "bytes": 0})
+        for field in ("files", "bytes"):
+            if want[field] != have[field]:
+                drift[f"by_type.{file_type}.{field}"] = want[field] - have[field]
+    await _apply(drift)
+    return {"drift": drift}
+
+register_job_handler("reconcile_stats", reconcile_stats_job)
+
+async def enqueue_stats_reconciliation():
+    return await enqueue_job("reconcile_stats", {})
+
+def _day_bounds(day: datetime):
+    start = datetime(day.year, day.month, day.day)
+    return start, start + timedelta(days=1)
+
+async def rollup_day(day: datetime):
+    """Precompute one day's uploads by type and downloads; rerunning it just overwrites the day."""
+    start, end = _day_bounds(day)
+    now = datetime.utcnow()
+    rollup = {"date": start, "uploads": 0, "upload_bytes": 0, "by_type": {}, "downloads": 0}
+    async for group in db.files.aggregate([
+        {"$match": {"uploaded_at": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": "$file_type", "uploads": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$size", 0]}}}}
+    ]):
+        rollup["by_type"][group["_id"] or "unknown"] = {"uploads": group["uploads"], "bytes": group["bytes"]}
+        rollup["uploads"] += group["uploads"]
+        rollup["upload_bytes"] += group["bytes"]
+    rollup["downloads"] = await db.audit_events.count_documents(
+        {"meta.type": "download", "at": {"$gte": start, "$lt": end}}
+    )
+    rollup.update(complete=end <= now, computed_at=now)
+    await db.storage_stats_daily.replace_one({"_id": start.strftime("%Y-%m-%d")}, rollup, upsert=True)
+
+async def rollup_pending_days():
+    """Roll up today, and every day in the backfill window not yet rolled up after it ended."""
+    today, _ = _day_bounds(datetime.utcnow())
+    first = today - timedelta(days=STATS_ROLLUP_BACKFILL_DAYS)
+    done = {
+        rollup["_id"] async for rollup in db.storage_stats_daily.find(
+            {"date": {"$gte": first}, "complete": True}, {"_id": 1}
+        )
+    }
+    day = first
+    while day <= today:
+        if day.strftime("%Y-%m-%d") not in done:
+            await rollup_day(day)
+        day += timedelta(days=1)
+
+async def read_daily(days: int):
+    today, _ = _day_bounds(datetime.utcnow())
+    cursor = db.storage_stats_daily.find({"date": {"$gt": today - timedelta(days=days)}}).sort("date", -1)
+    return await cursor.to_list(days)
+
+async def maintain_stats_forever():
+    """Keep daily rollups fresh and schedule reconciliation, on one worker at a time."""
+    while True:
+        try:
+            if await acquire_lease("stats-rollup", STATS_ROLLUP_INTERVAL_SECONDS):
+                await rollup_pending_days()
+            if await acquire_lease("stats-reconcile", STATS_RECONCILE_INTERVAL_SECONDS):
+                await enqueue_stats_reconciliation()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Storage stats maintenance failed")
+        await asyncio.sleep(min(STATS_ROLLUP_INTERVAL_SECONDS, 60))
@@ -0,0 +1,249 @@
+from starlette.concurrency import run_in_threadpool
+from app.utils.upload_utils import UPLOAD_DIR
+from app.utils.download_utils import open_local_source, forget_local_source, content_disposition
+from app.utils.encryption import BlobDecryptor, HEADER as ENCRYPTION_HEADER, MAGIC, is_encrypted_header
+import mimetypes
+import os
+from dotenv import load_dotenv
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 is only needed for STORAGE_BACKEND=s3
+    ClientError = None
+
+load_dotenv()
+
+# "local" keeps blobs on this node's disk; "s3" puts them in a bucket every replica can reach
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_KEY_PREFIX = os.getenv("S3_KEY_PREFIX", "blobs/")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_SIZE", str(16 * 1024 * 1024)))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "8"))
+S3_PRESIGNED_REDIRECTS = os.getenv("S3_PRESIGNED_REDIRECTS", "true").lower() == "true"
+S3_PRESIGN_EXPIRY_SECONDS = int(os.getenv("S3_PRESIGN_EXPIRY_SECONDS", "300"))
+
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+
+def blob_path(blob_id: str):
+    # Two levels of fan-out keep any one directory to a few thousand entries
+    return os.path.join(BLOB_DIR, blob_id[:2], blob_id[2:4], blob_id)
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class LocalStorage:
+    """Blobs on the local filesystem under uploads/blobs."""
+
+    def local_path(self, blob_id: str):
+        return blob_path(blob_id)
+
+    def _commit(self, incoming_path: str, blob_id: str, encrypted: bool):
+        dest_path = blob_path(blob_id)
+        if os.path.exists(dest_path):
+            os.remove(incoming_path)
+            # Reused bytes count as fresh, so the sweeper cannot reclaim them before the new reference lands
+            os.utime(dest_path)
+            # The stored copy wins; it may predate encryption being switched on (or off)
+            with open(dest_path, "rb") as existing:
+                return False, is_encrypted_header(existing.read(len(MAGIC)))
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        os.replace(incoming_path, dest_path)
+        return True, encrypted
+
+    async def commit(self, incoming_path: str, blob_id: str, encrypted: bool):
+        """Move a fully written file into place. Returns (created, encrypted) for the stored copy."""
+        return await run_in_threadpool(self._commit, incoming_path, blob_id, encrypted)
+
+    async def open(self, blob_id: str, encrypted: bool = False):
+        # Blobs are content-addressed and never rewritten, so their descriptors can stay open
+        return await open_local_source(blob_path(blob_id), cacheable=True, encrypted=encrypted)
+
+    def presigned_url(self, blob_id: str, filename: str):
+        return None
+
+    async def delete(self, blob_id: str):
+        forget_local_source(blob_path(blob_id))
+        await run_in_threadpool(_remove_quietly, blob_path(blob_id))
+
+class S3ObjectSource:
+    """Byte source for one download of an object.
+
+    A ranged GET is opened at the first read and kept streaming while reads stay sequential,
+    so a whole-file download costs one request rather than one per chunk.
+    """
+
+    file = None
+
+    def __init__(self, client, bucket: str, key: str):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self._body = None
+        self._position = None
+
+    def _read(self, offset: int, length: int):
+        if self._body is None or offset != self._position:
+            self.close()
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={offset}-")
+            self._body = response["Body"]
+            self._position = offset
+        data = self._body.read(length)
+        self._position += len(data)
+        return data
+
+    async def read(self, offset: int, length: int):
+        return await run_in_threadpool(self._read, offset, length)
+
+    def close(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+class EncryptedS3ObjectSource(S3ObjectSource):
+    """Plaintext view of an encrypted object; only the chunks covering a read are fetched and decrypted."""
+
+    def __init__(self, client, bucket: str, key: str, decryptor: BlobDecryptor):
+        super().__init__(client, bucket, key)
+        self.decryptor = decryptor
+
+    def _read_plaintext(self, offset: int, length: int):
+        first, start, span = self.decryptor.ciphertext_span(offset, length)
+        return self.decryptor.decrypt_span(first, self._read(start, span), offset, length)
+
+    async def read(self, offset: int, length: int):
+        return await run_in_threadpool(self._read_plaintext, offset, length)
+
+def _is_missing(error):
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+class S3Storage:
+    """Blobs as objects in an S3-compatible bucket (AWS S3, MinIO, moto).
+
+    One client is shared by every request; botocore pools its connections. Large blobs are
+    uploaded as multipart uploads whose parts are sent in parallel by the transfer manager.
+    """
+
+    def __init__(self, client, bucket: str, transfer_config=None, prefix: str = S3_KEY_PREFIX):
+        self.client = client
+        self.bucket = bucket
+        self.transfer_config = transfer_config
+        self.prefix = prefix
+
+    def key(self, blob_id: str):
+        return self.prefix + blob_id
+
+    def local_path(self, blob_id: str):
+        return None
+
+    def _head(self, key: str):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as error:
+            if _is_missing(error):
+                return None
+            raise
+
+    def _commit(self, incoming_path: str, blob_id: str, encrypted: bool):
+        key = self.key(blob_id)
+        try:
+            existing = self._head(key)
+            if existing is None:
+                self.client.upload_file(incoming_path, self.bucket, key, Config=self.transfer_config)
+                return True, encrypted
+            if existing["ContentLength"] < len(MAGIC):
+                return False, False
+            magic = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{len(MAGIC) - 1}")
+            return False, is_encrypted_header(magic["Body"].read())
+        finally:
+            _remove_quietly(incoming_path)
+
+    async def commit(self, incoming_path: str, blob_id: str, encrypted: bool):
+        """Upload a fully written file unless the object exists. Returns (created, encrypted)."""
+        return await run_in_threadpool(self._commit, incoming_path, blob_id, encrypted)
+
+    def _open(self, blob_id: str, encrypted: bool):
+        key = self.key(blob_id)
+        if not encrypted:
+            if self._head(key) is None:
+                raise FileNotFoundError(key)
+            return S3ObjectSource(self.client, self.bucket, key)
+
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=key, Range=f"bytes=0-{ENCRYPTION_HEADER.size - 1}"
+            )
+        except ClientError as error:
+            if _is_missing(error):
+                raise FileNotFoundError(key)
+            raise
+        header = response["Body"].read()
+        size = int(response["ContentRange"].rsplit("/", 1)[1])
+        return EncryptedS3ObjectSource(self.client, self.bucket, key, BlobDecryptor(header, size))
+
+    async def open(self, blob_id: str, encrypted: bool = False):
+        """Raises FileNotFoundError if the object is gone."""
+        return await run_in_threadpool(self._open, blob_id, encrypted)
+
+    def presigned_url(self, blob_id: str, filename: str):
+        """Short-lived GET URL so the client fetches the bytes from the bucket, not through the API."""
+        if not S3_PRESIGNED_REDIRECTS:
+            return None
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.key(blob_id),
+                "ResponseContentDisposition": content_disposition(filename),
+                "ResponseContentType": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            },
+            ExpiresIn=S3_PRESIGN_EXPIRY_SECONDS
+        )
+
+    async def delete(self, blob_id: str):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=self.key(blob_id))
+
+def build_s3_storage(bucket: str = S3_BUCKET, endpoint_url: str = S3_ENDPOINT_URL):
+    try:
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+    except ImportError:
+        raise RuntimeError("STORAGE_BACKEND=s3 requires the 'boto3' package")
+    if not bucket:
+        raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+
+    client = boto3.client(
+        "s3",
+        endpoint_url=endpoint_url or None,
+        region_name=S3_REGION,
+        config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={"mode": "adaptive"})
+    )
+    transfer_config = TransferConfig(
+        multipart_threshold=S3_MULTIPART_CHUNK_SIZE,
+        multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+        max_concurrency=S3_UPLOAD_CONCURRENCY
+    )
+    return S3Storage(client, bucket, transfer_config)
+
+def _build_storage():
+    if STORAGE_BACKEND == "local":
+        return LocalStorage()
+    if STORAGE_BACKEND == "s3":
+        return build_s3_storage()
+    raise RuntimeError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'")
+
+_storage = _build_storage()
+
+def get_storage():
+    return _storage
+
+def set_storage(driver):
+    """Swap the storage driver, e.g. for one backed by moto in tests."""
+    global _storage
+    _storage = driver
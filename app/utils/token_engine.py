@@ -0,0 +1,143 @@
+from jose import jwt, JWTError, ExpiredSignatureError
+from jose.utils import base64url_decode, base64url_encode
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    PublicFormat,
+    load_pem_private_key,
+    load_pem_public_key,
+)
+from calendar import timegm
+from datetime import datetime
+import json
+import time
+
+HMAC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+ASYMMETRIC_ALGORITHMS = {"ES256", "ES384", "ES512", "RS256", "RS384", "RS512"}
+EDDSA = "EdDSA"
+
+class SigningKey:
+    """One entry of the key ring. Keys without private material can only verify."""
+
+    def __init__(self, kid: str, alg: str, secret: str = None, private_key: str = None, public_key: str = None):
+        if alg not in HMAC_ALGORITHMS | ASYMMETRIC_ALGORITHMS | {EDDSA}:
+            raise ValueError(f"Unsupported JWT algorithm {alg!r} for key {kid!r}")
+        self.kid = kid
+        self.alg = alg
+
+        if alg in HMAC_ALGORITHMS:
+            if not secret:
+                raise ValueError(f"Key {kid!r} needs a secret")
+            self.signing_key = self.verify_key = secret
+            return
+
+        if not (private_key or public_key):
+            raise ValueError(f"Key {kid!r} needs a private_key or public_key")
+        if alg == EDDSA:
+            self.signing_key = load_pem_private_key(private_key.encode(), password=None) if private_key else None
+            self.verify_key = (
+                load_pem_public_key(public_key.encode()) if public_key else self.signing_key.public_key()
+            )
+        else:
+            self.signing_key = private_key
+            self.verify_key = public_key or _public_pem(private_key)
+
+    @property
+    def can_sign(self):
+        return self.signing_key is not None
+
+def _public_pem(private_key: str):
+    key = load_pem_private_key(private_key.encode(), password=None)
+    return key.public_key().public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode()
+
+def _b64_json(data: dict):
+    return base64url_encode(json.dumps(data, separators=(",", ":")).encode())
+
+def _eddsa_encode(claims: dict, key: SigningKey):
+    header = {"alg": EDDSA, "typ": "JWT", "kid": key.kid}
+    signing_input = _b64_json(header) + b"." + _b64_json(claims)
+    signature = key.signing_key.sign(signing_input)
+    return (signing_input + b"." + base64url_encode(signature)).decode()
+
+def _eddsa_decode(token: str, key: SigningKey):
+    try:
+        header_segment, claims_segment, signature_segment = token.encode().split(b".")
+        key.verify_key.verify(base64url_decode(signature_segment), header_segment + b"." + claims_segment)
+        claims = json.loads(base64url_decode(claims_segment))
+    except InvalidSignature:
+        raise JWTError("Signature verification failed.")
+    except (ValueError, TypeError):
+        raise JWTError("Invalid token")
+
+    now = time.time()
+    if "exp" in claims and now >= claims["exp"]:
+        raise ExpiredSignatureError("Signature has expired.")
+    if "nbf" in claims and now < claims["nbf"]:
+        raise JWTError("The token is not yet valid (nbf)")
+    return claims
+
+class TokenEngine:
+    """Sign with the active key and verify against any key in the ring, selected by ``kid``."""
+
+    def __init__(self, keys, active_kid: str, fallback_kid: str = None):
+        self.keys = {key.kid: key for key in keys}
+        if active_kid not in self.keys or not self.keys[active_kid].can_sign:
+            raise ValueError(f"Active key {active_kid!r} is missing or has no private material")
+        self.active_kid = active_kid
+        # Tokens minted before kid headers existed are checked against this key
+        self.fallback_kid = fallback_kid or active_kid
+
+    def encode(self, claims: dict):
+        key = self.keys[self.active_kid]
+        claims = dict(claims)
+        for name in ("exp", "iat", "nbf"):
+            if isinstance(claims.get(name), datetime):
+                claims[name] = timegm(claims[name].utctimetuple())
+        if key.alg == EDDSA:
+            return _eddsa_encode(claims, key)
+        return jwt.encode(claims, key.signing_key, algorithm=key.alg, headers={"kid": key.kid})
+
+    def decode(self, token: str):
+        header = jwt.get_unverified_header(token)
+        key = self.keys.get(header.get("kid") or self.fallback_kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        if header.get("alg") != key.alg:
+            raise JWTError("Token algorithm does not match its key")
+        if key.alg == EDDSA:
+            return _eddsa_decode(token, key)
+        return jwt.decode(token, key.verify_key, algorithms=[key.alg])
+
+def _read_key_material(entry: dict, name: str):
+    if entry.get(name):
+        return entry[name]
+    if entry.get(f"{name}_file"):
+        with open(entry[f"{name}_file"]) as handle:
+            return handle.read()
+    return None
+
+def load_token_engine(keys_file: str = None, default_secret: str = None, default_algorithm: str = "HS256"):
+    """Build the engine from a JSON key ring file, or a single HMAC key when none is configured.
+
+    The file looks like::
+
+        {"active_kid": "2026-10", "fallback_kid": "legacy",
+         "keys": [{"kid": "2026-10", "alg": "EdDSA", "private_key_file": "keys/2026-10.pem"},
+                  {"kid": "legacy", "alg": "HS256", "secret": "..."}]}
+    """
+    if not keys_file:
+        return TokenEngine([SigningKey("default", default_algorithm, secret=default_secret)], "default")
+
+    with open(keys_file) as handle:
+        config = json.load(handle)
+    keys = [
+        SigningKey(
+            entry["kid"],
+            entry["alg"],
+            secret=entry.get("secret"),
+            private_key=_read_key_material(entry, "private_key"),
+            public_key=_read_key_material(entry, "public_key"),
+        )
+        for entry in config["keys"]
+    ]
+    return TokenEngine(keys, config["active_kid"], config.get("fallback_kid"))
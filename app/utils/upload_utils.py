@@ -0,0 +1,75 @@
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIRECTORY", "uploads")
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(500 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    # UploadFile.read hands disk-backed spools to the threadpool itself
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+async def iter_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    with open(path, "rb") as source:
+        while True:
+            chunk = await run_in_threadpool(source.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def _write_chunk(buffer, hasher, chunk: bytes):
+    buffer.write(chunk)
+    if hasher is not None:
+        hasher.update(chunk)
+
+def _sync_and_close(buffer):
+    buffer.flush()
+    os.fsync(buffer.fileno())
+    buffer.close()
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def write_stream_atomic(chunks, dest_path: str, max_size: int = None, hasher=None, before_replace=None):
+    """Write an async iterator of byte chunks to dest_path without blocking the event loop.
+
+    Data lands in a temp file next to the destination, is fsynced and then renamed
+    over dest_path, so readers never see a partial file. If a hashlib object is given
+    it is fed every chunk on the way through. before_replace, if given, is awaited with
+    the size just before the rename; raising from it leaves dest_path untouched.
+    Returns the number of bytes written.
+    """
+    max_size = MAX_FILE_SIZE if max_size is None else max_size
+    directory = os.path.dirname(dest_path) or "."
+    fd, tmp_path = await run_in_threadpool(
+        tempfile.mkstemp, dir=directory, prefix=".upload-", suffix=".part"
+    )
+    buffer = os.fdopen(fd, "wb")
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=413, detail="File too large")
+            await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+        await run_in_threadpool(_sync_and_close, buffer)
+        if before_replace is not None:
+            await before_replace(size)
+        await run_in_threadpool(os.replace, tmp_path, dest_path)
+    except BaseException:
+        buffer.close()
+        await run_in_threadpool(_remove_quietly, tmp_path)
+        raise
+    return size
@@ -0,0 +1,73 @@
+from starlette.concurrency import run_in_threadpool
+import os
+import zipfile
+
+# Office Open XML files are already deflated zip containers; compressing them again is wasted CPU
+STORED_EXTENSIONS = {"docx", "pptx", "xlsx", "zip", "jpg", "jpeg", "png"}
+ZIP_READ_CHUNK_SIZE = int(os.getenv("ZIP_READ_CHUNK_SIZE", str(1024 * 1024)))
+
+class _ChunkSink:
+    """Unseekable file object that hands whatever zipfile wrote to the caller in pieces."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def unique_arcname(filename: str, taken: set):
+    name, ext = os.path.splitext(filename)
+    candidate, counter = filename, 1
+    while candidate in taken:
+        counter += 1
+        candidate = f"{name} ({counter}){ext}"
+    taken.add(candidate)
+    return candidate
+
+async def stream_zip(entries):
+    """Build a ZIP archive on the fly and yield it in chunks.
+
+    entries is an iterable of (arcname, size, modified_at, open_source). open_source is an
+    async callable returning a byte source with read(offset, length) and close(). Only one
+    chunk per file is held in memory at a time, whatever the number or size of the files.
+    """
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, mode="w", allowZip64=True)
+
+    for arcname, size, modified_at, open_source in entries:
+        info = zipfile.ZipInfo(arcname, date_time=modified_at.timetuple()[:6])
+        ext = arcname.rsplit(".", 1)[-1].lower()
+        info.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+        info.file_size = size
+
+        source = await open_source()
+        try:
+            with archive.open(info, mode="w") as entry:
+                offset = 0
+                while offset < size:
+                    chunk = await source.read(offset, min(ZIP_READ_CHUNK_SIZE, size - offset))
+                    if not chunk:
+                        raise RuntimeError(f"{arcname} is shorter than its recorded size")
+                    offset += len(chunk)
+                    await run_in_threadpool(entry.write, chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+        finally:
+            source.close()
+
+        data = sink.drain()
+        if data:
+            yield data
+
+    archive.close()
+    yield sink.drain()
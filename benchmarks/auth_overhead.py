@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of per-request auth overhead: token verification per algorithm,
+with and without the verified-claims cache, and the verify_user_type dependency itself.
+
+    python benchmarks/auth_overhead.py --iterations 20000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import auth_utils
+from app.utils.cache import TTLCache
+from app.utils.token_engine import SigningKey, TokenEngine
+
+def private_pem(key):
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+def engines():
+    yield "HS256", TokenEngine([SigningKey("hs", "HS256", secret="x" * 64)], "hs")
+    es_key = private_pem(ec.generate_private_key(ec.SECP256R1()))
+    yield "ES256", TokenEngine([SigningKey("es", "ES256", private_key=es_key)], "es")
+    ed_key = private_pem(ed25519.Ed25519PrivateKey.generate())
+    yield "EdDSA", TokenEngine([SigningKey("ed", "EdDSA", private_key=ed_key)], "ed")
+
+def per_call_us(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+def report(name, uncached, cached):
+    print(f"{name:<22} uncached={uncached:8.2f}us  cached={cached:6.2f}us  speedup={uncached / cached:6.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    claims = {"sub": "bench@example.com", "role": "client", "exp": datetime.utcnow() + timedelta(hours=1)}
+
+    for name, engine in engines():
+        token = engine.encode(claims)
+        cache = TTLCache(1024, 300)
+
+        def cached_decode():
+            value = cache.get(token)
+            if value is None:
+                cache.set(token, engine.decode(token))
+
+        uncached = per_call_us(lambda: engine.decode(token), args.iterations)
+        cached = per_call_us(cached_decode, args.iterations)
+        report(f"decode {name}", uncached, cached)
+
+    # The real dependency, as FastAPI calls it on every authenticated request
+    token = auth_utils.create_jwt_token("bench@example.com", "client")
+
+    async def dependency_loop(clear):
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            if clear:
+                auth_utils._token_cache.clear()
+            await auth_utils.verify_user_type(token)
+        return (time.perf_counter() - started) / args.iterations * 1e6
+
+    uncached = asyncio.run(dependency_loop(clear=True))
+    cached = asyncio.run(dependency_loop(clear=False))
+    report(f"verify_user_type {auth_utils.ALGORITHM}", uncached, cached)
+
+if __name__ == "__main__":
+    main()
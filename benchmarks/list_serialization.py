@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Serialization cost of a /file/list page, before and after the orjson response class.
+
+Builds --rows list rows shaped like the ones the route returns (str ids, datetimes)
+and times each way of turning them into a response body, reported per 10k rows:
+
+    before           jsonable_encoder + JSONResponse (json.dumps), the previous route path
+    response_model   FastAPI validating the rows against FileListResponse first
+    after            ORJSONResponse straight from the rows
+    msgpack          MsgpackResponse, when msgpack is installed
+
+    python benchmarks/list_serialization.py --rows 10000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi._compat import ModelField
+from pydantic.fields import FieldInfo
+
+from app.schemas.file_schema import FileListResponse
+from app.utils import responses
+from app.utils.responses import ORJSONResponse, MsgpackResponse
+
+def make_page(rows: int):
+    started = datetime(2025, 1, 1, 12, 0, 0, 123000)
+    files = [
+        {
+            "file_id": str(ObjectId()),
+            "filename": f"quarterly-report-{index:06d}.xlsx",
+            "file_type": ".xlsx",
+            "uploader": "ops@example.com",
+            "uploaded_at": started - timedelta(seconds=index),
+        }
+        for index in range(rows)
+    ]
+    return {"files": files, "total_files": rows, "next_cursor": "NjdhYmNkZWY"}
+
+def before(content, field):
+    return JSONResponse(jsonable_encoder(content)).body
+
+def validated(content, field):
+    # What FastAPI does for a dict returned from a route with a response_model
+    value = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(value).body
+
+def after(content, field):
+    return ORJSONResponse(content).body
+
+def packed(content, field):
+    return MsgpackResponse(content).body
+
+def measure(encode, content, field, repeat):
+    body = encode(content, field)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(content, field)
+        best = min(best, time.perf_counter() - started)
+    return best, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    content = make_page(args.rows)
+    field = ModelField(name="Response_list_all_files", field_info=FieldInfo(annotation=FileListResponse), mode="serialization")
+
+    paths = [
+        ("before (jsonable_encoder)", before),
+        ("response_model validation", validated),
+        ("after (orjson)", after),
+    ]
+    if responses.msgpack is not None:
+        paths.append(("msgpack", packed))
+
+    scale = 10000 / args.rows
+    baseline = None
+    for name, encode in paths:
+        seconds, size = measure(encode, content, field, args.repeat)
+        per_10k = seconds * scale * 1000
+        baseline = baseline or per_10k
+        print(f"{name:36} {per_10k:8.2f} ms / 10k rows  {size * scale / 1024:8.1f} KiB / 10k rows  x{baseline / per_10k:5.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+In-process load suite for the auth -> list -> upload -> download flow.
+
+The app is driven through httpx's ASGI transport, so no server or network is involved.
+MongoDB is replaced by mongomock-motor unless --mongo-url points at a real server. In that
+case a throwaway database is used and dropped afterwards. Every scenario reports
+throughput, p50/p95/p99 latency and RSS. The results are written as JSON so two commits
+can be compared:
+
+    pip install mongomock-motor
+    python benchmarks/load_suite.py --output before.json
+    git checkout <other commit>
+    python benchmarks/load_suite.py --output after.json --compare before.json
+
+Scenarios (--scenarios, comma separated): auth, list, search, upload, download. search
+needs --mongo-url because mongomock has no text index.
+With mongomock the database work runs on the same event loop as the app, so absolute
+numbers are pessimistic; compare runs made with the same backend.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHUNK = b"\0" * (1024 * 1024)
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Recorder:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self.rss_before = rss_mb()
+        self.started = time.perf_counter()
+
+    async def time(self, call, expected=(200,)):
+        started = time.perf_counter()
+        response = await call()
+        self.latencies.append(time.perf_counter() - started)
+        if response.status_code not in expected:
+            self.errors += 1
+        return response
+
+    def result(self, **extra):
+        elapsed = time.perf_counter() - self.started
+        summary = {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "throughput_per_s": round(len(self.latencies) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(self.latencies, 50) * 1000, 2),
+                "p95": round(percentile(self.latencies, 95) * 1000, 2),
+                "p99": round(percentile(self.latencies, 99) * 1000, 2),
+                "mean": round(statistics.mean(self.latencies) * 1000, 2) if self.latencies else 0.0,
+                "max": round(max(self.latencies, default=0) * 1000, 2),
+            },
+            "rss_mb": {
+                "before": round(self.rss_before, 1),
+                "after": round(rss_mb(), 1),
+                "peak": round(peak_rss_mb(), 1),
+            },
+        }
+        if self.bytes:
+            summary["mb_per_s"] = round(self.bytes / 2**20 / elapsed, 1)
+        summary.update(extra)
+        lat = summary["latency_ms"]
+        print(
+            f"{self.name:<22} n={summary['requests']:<6} err={self.errors:<4} "
+            f"{summary['throughput_per_s']:9.1f}/s  p50={lat['p50']:8.1f}ms p95={lat['p95']:8.1f}ms "
+            f"p99={lat['p99']:8.1f}ms  rss={summary['rss_mb']['after']:.0f}MB"
+            + (f"  {summary['mb_per_s']:.1f} MB/s" if self.bytes else "")
+        )
+        return summary
+
+async def bounded(concurrency, jobs):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(job):
+        async with semaphore:
+            return await job()
+
+    return await asyncio.gather(*[run(job) for job in jobs])
+
+async def seed_users(db, hash_password):
+    await db.users.insert_one({
+        "email": "bench-ops@example.com", "password": hash_password("bench-pass"), "role": "ops", "verified": True
+    })
+    await db.users.insert_one({
+        "email": "bench-client@example.com", "password": hash_password("bench-pass"), "role": "client", "verified": True
+    })
+
+async def login(client, email, role):
+    response = await client.post(f"/auth/{role}/login", json={"email": email, "password": "bench-pass"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def scenario_auth(client, db, args):
+    emails = [f"bench-user-{i}@example.com" for i in range(args.users)]
+
+    signups = Recorder("auth: signup storm")
+    await bounded(args.concurrency, [
+        lambda email=email: signups.time(
+            lambda: client.post("/auth/client/signup", json={"email": email, "password": "bench-pass"})
+        )
+        for email in emails
+    ])
+    results = {"auth_signup": signups.result(users=args.users)}
+
+    await db.users.update_many({"email": {"$in": emails}}, {"$set": {"verified": True}})
+    logins = Recorder("auth: login storm")
+    await bounded(args.concurrency, [
+        lambda email=email: logins.time(
+            lambda: client.post("/auth/client/login", json={"email": email, "password": "bench-pass"})
+        )
+        for email in emails
+    ])
+    results["auth_login"] = logins.result(users=args.users)
+    await db.users.delete_many({"email": {"$in": emails}})
+    return results
+
+SEARCH_VOCABULARY = (
+    "revenue forecast budget contract invoice quarterly roadmap hiring audit compliance "
+    "migration incident postmortem pricing churn retention launch partner vendor security"
+).split()
+
+def synthetic_text(i):
+    # Deterministic pseudo-random paragraphs so every run indexes the same corpus
+    words = [SEARCH_VOCABULARY[(i * 7 + j * j) % len(SEARCH_VOCABULARY)] for j in range(200)]
+    return " ".join(words) + f" document{i}"
+
+async def seed_files(db, count, with_text=False):
+    await db.files.delete_many({})
+    started = datetime.utcnow()
+    batch = []
+    for i in range(count):
+        batch.append({
+            "filename": f"report-{i:07d}.docx",
+            "file_type": ("docx", "pptx", "xlsx")[i % 3],
+            "uploader": "ops",
+            "uploaded_at": started - timedelta(seconds=i),
+            **({"text": synthetic_text(i)} if with_text else {}),
+        })
+        if len(batch) == 10000:
+            await db.files.insert_many(batch)
+            batch = []
+    if batch:
+        await db.files.insert_many(batch)
+
+async def scenario_list(client, db, args, headers):
+    results = {}
+    for count in args.list_sizes:
+        await seed_files(db, count)
+
+        first_page = Recorder(f"list: n={count} page")
+        await bounded(args.concurrency, [
+            lambda: first_page.time(lambda: client.get("/file/list", params={"limit": 100}, headers=headers))
+            for _ in range(args.list_requests)
+        ])
+        results[f"list_first_page_{count}"] = first_page.result(files=count)
+
+        walk = Recorder(f"list: n={count} cursor")
+        cursor = None
+        for _ in range(args.list_pages):
+            params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+            response = await walk.time(lambda: client.get("/file/list", params=params, headers=headers))
+            cursor = response.json().get("next_cursor")
+            if not cursor:
+                break
+        results[f"list_cursor_walk_{count}"] = walk.result(files=count)
+    await db.files.delete_many({})
+    return results
+
+async def scenario_search(client, db, args, headers):
+    if not args.mongo_url:
+        print("search: skipped, needs --mongo-url (mongomock has no $text support)")
+        return {}
+    results = {}
+    queries = ["revenue", "quarterly audit", "document42", "security incident postmortem", "nonexistentword"]
+    for count in args.list_sizes:
+        await seed_files(db, count, with_text=True)
+        search = Recorder(f"search: n={count}")
+        await bounded(args.concurrency, [
+            lambda query=queries[i % len(queries)]: search.time(
+                lambda: client.get("/file/search", params={"q": query}, headers=headers)
+            )
+            for i in range(args.list_requests)
+        ])
+        results[f"search_{count}"] = search.result(files=count)
+    await db.files.delete_many({})
+    return results
+
+def multipart_upload(client, headers, name, size_mb):
+    boundary = "benchboundary"
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    async def body():
+        yield head
+        for index in range(size_mb):
+            # Vary one byte per file so uploads are not deduplicated into one blob
+            yield CHUNK if index else name.encode().ljust(len(CHUNK), b"\0")
+        yield tail
+
+    return client.post(
+        "/file/upload",
+        content=body(),
+        headers={**headers, "Content-Type": f"multipart/form-data; boundary={boundary}"},
+        timeout=None,
+    )
+
+async def scenario_upload(client, args, headers):
+    uploads = Recorder("upload: concurrent")
+    await bounded(args.concurrency, [
+        lambda i=i: uploads.time(lambda: multipart_upload(client, headers, f"bench-{i}.docx", args.size_mb))
+        for i in range(args.uploads)
+    ])
+    uploads.bytes = args.uploads * args.size_mb * 2**20
+    return {"upload": uploads.result(size_mb=args.size_mb, uploads=args.uploads)}
+
+async def scenario_download(client, args, ops_headers, client_headers):
+    response = await multipart_upload(client, ops_headers, "bench-download.docx", args.size_mb)
+    response.raise_for_status()
+    file_id = response.json()["file_id"]
+    link = (await client.get(f"/file/download/{file_id}", headers=client_headers)).json()["download_link"]
+    path = link.split("127.0.0.1:8009", 1)[-1]
+
+    downloads = Recorder("download: parallel")
+
+    async def fetch():
+        async with client.stream("GET", path) as streamed:
+            async for chunk in streamed.aiter_bytes():
+                downloads.bytes += len(chunk)
+        return streamed
+
+    await bounded(args.concurrency, [lambda: downloads.time(fetch) for _ in range(args.downloads)])
+    return {"download": downloads.result(size_mb=args.size_mb, downloads=args.downloads)}
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\ncompared with {baseline_path} (commit {baseline.get('commit')})")
+    regressed = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        before, after = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        change = (after - before) / before * 100 if before else 0.0
+        rate_before, rate_after = previous["throughput_per_s"], current["throughput_per_s"]
+        rate_change = (rate_after - rate_before) / rate_before * 100 if rate_before else 0.0
+        flag = "REGRESSION" if change > tolerance else ""
+        print(f"{name:<28} p95 {before:8.1f} -> {after:8.1f}ms ({change:+6.1f}%)  throughput {rate_change:+6.1f}%  {flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+async def run(args):
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+        os.environ["MONGO_DB_NAME"] = f"sfs_bench_{os.getpid()}"
+    os.environ["UPLOAD_DIRECTORY"] = args.upload_dir
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    # Every simulated user shares one address and storms are the point, so lift the abuse limits
+    for name in ("AUTH_IP_BURST", "AUTH_ACCOUNT_BURST", "UPLOAD_CONCURRENCY_PER_USER", "DOWNLOAD_CONCURRENCY_PER_USER"):
+        os.environ.setdefault(name, "1000000")
+
+    import httpx
+    import app.db.mongo as mongo
+    if not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("mongomock-motor is required without --mongo-url: pip install mongomock-motor")
+        # Swap the database before any route module binds app.db.mongo.db
+        mongo.client = AsyncMongoMockClient()
+        mongo.db = mongo.client[mongo.MONGO_DB_NAME]
+        # mongomock has no capped or time series collections; plain ones behave the same here
+        mongo.COLLECTION_OPTIONS = {}
+
+    from app.main import app
+    from app.utils.auth_utils import hash_password
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.mongo_url or "mongomock",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {},
+    }
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            await seed_users(mongo.db, hash_password)
+            ops_headers = await login(client, "bench-ops@example.com", "ops")
+            client_headers = await login(client, "bench-client@example.com", "client")
+
+            if "auth" in args.scenarios:
+                results["scenarios"].update(await scenario_auth(client, mongo.db, args))
+            if "list" in args.scenarios:
+                results["scenarios"].update(await scenario_list(client, mongo.db, args, client_headers))
+            if "search" in args.scenarios:
+                results["scenarios"].update(await scenario_search(client, mongo.db, args, client_headers))
+            if "upload" in args.scenarios:
+                results["scenarios"].update(await scenario_upload(client, args, ops_headers))
+            if "download" in args.scenarios:
+                results["scenarios"].update(await scenario_download(client, args, ops_headers, client_headers))
+
+        if args.mongo_url:
+            await mongo.client.drop_database(mongo.MONGO_DB_NAME)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="auth,list,search,upload,download", type=lambda v: v.split(","))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=100, help="accounts in the signup/login storm")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--list-sizes", default="1000,10000", type=lambda v: [int(n) for n in v.split(",")],
+                        help="collection sizes to list/search, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--list-requests", type=int, default=200, help="first-page requests per size")
+    parser.add_argument("--list-pages", type=int, default=20, help="pages of 1000 walked with the cursor")
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--downloads", type=int, default=32)
+    parser.add_argument("--size-mb", type=int, default=64, help="size of each uploaded/downloaded file")
+    parser.add_argument("--mongo-url", help="benchmark against a real MongoDB instead of mongomock")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="previous --output file; p95 regressions beyond --tolerance fail the run")
+    parser.add_argument("--tolerance", type=float, default=20.0, help="allowed p95 increase in percent")
+    args = parser.parse_args()
+
+    args.upload_dir = tempfile.mkdtemp(prefix="sfs-bench-")
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(args.upload_dir, ignore_errors=True)
+    del results["config"]["upload_dir"]
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Worker cold start: how long `import app.main` takes in a fresh interpreter, which imports
+dominate it, and how long the lifespan startup (directories, Mongo ping, pool warm-up,
+indexes, background tasks) and shutdown take.
+
+Every worker the launcher spawns pays both costs before it can serve, so they add up
+across WEB_CONCURRENCY workers on every deploy and restart.
+
+    python benchmarks/startup_time.py --runs 5
+    python benchmarks/startup_time.py --mongo-url mongodb://localhost:27017
+
+MongoDB is replaced by mongomock-motor unless --mongo-url is given. In that case the
+lifespan numbers leave out the network round trips, so compare runs made with the same
+backend.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def timed_run(code: str, importtime: bool = False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, completed.stderr
+
+def slowest_imports(importtime_log: str, top: int):
+    """Top-level packages by total self import time, from `python -X importtime` output."""
+    totals = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(own)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+async def time_lifespan(app):
+    started = time.perf_counter()
+    context = app.router.lifespan_context(app)
+    await context.__aenter__()
+    ready = time.perf_counter() - started
+    started = time.perf_counter()
+    await context.__aexit__(None, None, None)
+    return ready, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--mongo-url", help="time the lifespan against a real MongoDB instead of mongomock")
+    args = parser.parse_args()
+
+    interpreter = [timed_run("pass")[0] for _ in range(args.runs)]
+    imports = [timed_run("import app.main")[0] for _ in range(args.runs)]
+    _, log = timed_run("import app.main", importtime=True)
+
+    baseline = statistics.median(interpreter)
+    print(f"interpreter start      {baseline * 1000:8.1f} ms (median of {args.runs})")
+    print(f"import app.main        {(statistics.median(imports) - baseline) * 1000:8.1f} ms on top, "
+          f"worst {(max(imports) - baseline) * 1000:.1f} ms")
+    for package, micros in slowest_imports(log, args.top):
+        print(f"    {package:26} {micros / 1000:8.1f} ms")
+
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+    from app.db import mongo
+    if not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("mongomock-motor is required without --mongo-url: pip install mongomock-motor")
+        # Swap the database before any route module binds app.db.mongo.db
+        mongo.client = AsyncMongoMockClient()
+        mongo.db = mongo.client[mongo.MONGO_DB_NAME]
+        # mongomock has no capped or time series collections; plain ones behave the same here
+        mongo.COLLECTION_OPTIONS = {}
+    from app.main import app
+
+    ready, stopped = asyncio.run(time_lifespan(app))
+    print(f"lifespan startup       {ready * 1000:8.1f} ms ({args.mongo_url and 'mongodb' or 'mongomock'})")
+    print(f"lifespan shutdown      {stopped * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Measure /health and /auth/token latency while large uploads are in flight.
+
+Run the API first (uvicorn app.main:app --port 8009), then:
+    python benchmarks/upload_latency.py --uploads 4 --size-mb 300
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import httpx
+
+BASE_URL = os.getenv("BENCH_BASE_URL", "http://127.0.0.1:8009")
+OPS_EMAIL = os.getenv("BENCH_OPS_EMAIL", "ops@example.com")
+OPS_PASSWORD = os.getenv("BENCH_OPS_PASSWORD", "opspass123")
+
+CHUNK = b"\0" * (1024 * 1024)
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(name, samples):
+    if not samples:
+        print(f"{name:<12} no samples")
+        return
+    print(
+        f"{name:<12} n={len(samples):<5} "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms "
+        f"mean={statistics.mean(samples) * 1000:8.1f}ms"
+    )
+
+async def get_token(client):
+    response = await client.post(
+        "/auth/token", data={"username": OPS_EMAIL, "password": OPS_PASSWORD}
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def upload_body(size_mb):
+    for _ in range(size_mb):
+        yield CHUNK
+
+async def upload(client, token, index, size_mb):
+    boundary = "benchboundary"
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="bench_{index}.xlsx"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    async def body():
+        yield head
+        async for chunk in upload_body(size_mb):
+            yield chunk
+        yield tail
+
+    response = await client.post(
+        "/file/upload",
+        content=body(),
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+        },
+        timeout=None,
+    )
+    return response.status_code
+
+async def probe(client, path, samples, stop, interval, **kwargs):
+    method = client.post if kwargs else client.get
+    while not stop.is_set():
+        started = time.perf_counter()
+        await method(path, **kwargs)
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60) as client:
+        token = await get_token(client)
+
+        health, login = [], []
+        stop = asyncio.Event()
+        probes = [
+            asyncio.create_task(probe(client, "/health", health, stop, args.interval)),
+            asyncio.create_task(probe(
+                client, "/auth/token", login, stop, args.interval,
+                data={"username": OPS_EMAIL, "password": OPS_PASSWORD},
+            )),
+        ]
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*[
+            upload(client, token, i, args.size_mb) for i in range(args.uploads)
+        ])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*probes)
+
+    total_mb = args.uploads * args.size_mb
+    print(f"uploads: {args.uploads} x {args.size_mb} MB, statuses={statuses}")
+    print(f"upload wall time: {elapsed:.2f}s ({total_mb / elapsed:.1f} MB/s aggregate)")
+    summarize("/health", health)
+    summarize("/auth/token", login)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=4, help="concurrent uploads")
+    parser.add_argument("--size-mb", type=int, default=300, help="size of each upload in MB")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between probes")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
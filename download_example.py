@@ -124,6 +124,42 @@ def download_file(download_link, filename):
         print(f" Download error: {e}")
         return None
 
+def download_all(token, files):
+    print(f"\n💾 Downloading all {len(files)} file(s) as one ZIP...")
+
+    headers = {"Authorization": f"Bearer {token}"}
+
+    try:
+        response = requests.post(
+            f"{BASE_URL}/file/download/bulk",
+            json={"file_ids": [file_info["file_id"] for file_info in files]},
+            headers=headers
+        )
+        if response.status_code != 200:
+            print(f" Failed to generate link: {response.json().get('detail', 'Unknown error')}")
+            return None
+
+        download_link = response.json()["download_link"]
+        os.makedirs("downloads", exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        safe_filename = f"downloads/{timestamp}_files.zip"
+
+        with requests.get(download_link, stream=True) as archive:
+            if archive.status_code != 200:
+                print(f" Download failed: Status {archive.status_code}")
+                return None
+            with open(safe_filename, "wb") as f:
+                for chunk in archive.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+
+        print(f" Saved as: {safe_filename}")
+        print(f" Size: {os.path.getsize(safe_filename)} bytes")
+        return safe_filename
+
+    except requests.exceptions.RequestException as e:
+        print(f" Download error: {e}")
+        return None
+
 def main():
     print_header()
     
@@ -138,11 +174,15 @@ def main():
     print("🎯 Select a file to download:")
     try:
         while True:
-            choice = input(f"Enter number (1-{len(files)}) or 'q' to quit: ").strip()
+            choice = input(f"Enter number (1-{len(files)}), 'a' for all as ZIP or 'q' to quit: ").strip()
             
             if choice.lower() == 'q':
                 print(" Goodbye!")
                 return
+
+            if choice.lower() == 'a':
+                download_all(token, files)
+                return
             
             try:
                 file_index = int(choice) - 1
@@ -1,10 +1,67 @@
 import pytest
 import asyncio
+import os
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
+from anyio.from_thread import start_blocking_portal
 from app.main import app
+from app.utils.upload_utils import write_stream_atomic
+from app.utils.download_utils import parse_range_header, RangeNotSatisfiable, FileHandleCache, open_local_source, starts_download
+from app.utils.blob_store import blob_path, file_path_for, BLOB_DIR
+from app.utils import storage
+from app.utils.office_extract import extract_office_document, OfficeDocumentError
+from app.utils.metrics import Histogram, MongoCommandTimer, mongo_command_duration_seconds
+from app.utils import auth_utils
+from passlib.context import CryptContext
+from jose import jwt, JWTError
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from app.utils.token_engine import TokenEngine, SigningKey
+from app.utils import metadata_cache
+from app.utils.zip_stream import stream_zip, unique_arcname
+import hashlib
+import io
+import time
+import zipfile
+from bson import ObjectId
+from datetime import datetime, timedelta
+from app.utils import encryption
+from cryptography.exceptions import InvalidTag
+from starlette.requests import Request
+from app.utils import rate_limit
+from app.utils import responses
+from app import server
+from app.utils.download_tokens import RevocationIndex
+from app.utils.audit import AuditLog
+from app.utils import stats
+from app.utils import retention
+from app.routes import file_routes
+from app.db.mongo import db
+import uuid
+from fastapi.encoders import jsonable_encoder
+import json
 
 client = TestClient(app)
 
+@pytest.fixture(scope="module", autouse=True)
+def shared_event_loop():
+    # Motor stays on the first event loop it runs on, so requests and direct db calls share one
+    with start_blocking_portal() as portal:
+        client.portal = portal
+        yield
+        client.portal = None
+
+def run_db(call, *args, **kwargs):
+    # Motor returns futures, which the portal only awaits from inside a coroutine
+    async def awaited():
+        return await call(*args, **kwargs)
+    return client.portal.call(awaited)
+
+@pytest.fixture(autouse=True)
+def fresh_rate_limits():
+    # Every test logs in from the same test client address
+    rate_limit.set_bucket_store(rate_limit.MemoryBucketStore())
+
 class TestSecureFileSharing:
     
     def setup_method(self):
@@ -130,6 +187,34 @@ class TestSecureFileSharing:
         assert response.status_code == 401
         assert "Invalid credentials" in response.json()["detail"]
 
+    def test_13_client_cannot_start_chunked_upload(self):
+        login_response = client.post("/auth/client/login", json=self.client_user)
+        token = login_response.json()["access_token"]
+
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.post("/file/uploads", json={"filename": "deck.pptx"}, headers=headers)
+        assert response.status_code == 403
+        assert "Only Ops can upload files" in response.json()["detail"]
+
+    def test_14_ops_cannot_search_files(self):
+        login_response = client.post("/auth/ops/login", json=self.ops_user)
+        token = login_response.json()["access_token"]
+
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/file/search", params={"q": "revenue"}, headers=headers)
+        assert response.status_code == 403
+        assert "Only clients can search files" in response.json()["detail"]
+
+    def test_15_client_cannot_batch_upload(self):
+        login_response = client.post("/auth/client/login", json=self.client_user)
+        token = login_response.json()["access_token"]
+
+        headers = {"Authorization": f"Bearer {token}"}
+        files = [("files", (f"report{i}.docx", b"fake word content", "application/octet-stream")) for i in range(2)]
+        response = client.post("/file/upload/batch", files=files, headers=headers)
+        assert response.status_code == 403
+        assert "Only Ops can upload files" in response.json()["detail"]
+
 class TestSecurityFeatures:
     
     def test_jwt_token_expiry(self):
@@ -141,10 +226,648 @@ class TestSecurityFeatures:
         assert response.status_code in [400, 401]
         
     def test_file_path_traversal_prevention(self):
-        pass
+        # Stored files are addressed by content hash, never by the client-supplied name
+        meta = {"filename": "../../etc/passwd", "blob_id": "ab" * 32}
+        assert file_path_for(meta) == os.path.join(BLOB_DIR, "ab", "ab", "ab" * 32)
+        assert blob_path("0123" + "f" * 60).startswith(os.path.join(BLOB_DIR, "01", "23"))
         
-    def test_large_file_upload_handling(self):
-        pass
+    def test_large_file_upload_handling(self, tmp_path):
+        async def chunks():
+            for _ in range(4):
+                yield b"x" * 1024
+
+        dest = tmp_path / "big.xlsx"
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(write_stream_atomic(chunks(), str(dest), max_size=2048))
+        assert exc.value.status_code == 413
+        assert os.listdir(tmp_path) == []
+
+        size = asyncio.run(write_stream_atomic(chunks(), str(dest), max_size=4096))
+        assert size == 4096
+        assert dest.read_bytes() == b"x" * 4096
+
+    def test_rejected_write_keeps_existing_file(self, tmp_path):
+        async def chunks():
+            yield b"corrupt"
+
+        async def reject(size):
+            raise HTTPException(status_code=400, detail="Part checksum mismatch")
+
+        dest = tmp_path / "00001.part"
+        dest.write_bytes(b"accepted")
+        with pytest.raises(HTTPException):
+            asyncio.run(write_stream_atomic(chunks(), str(dest), before_replace=reject))
+        assert dest.read_bytes() == b"accepted"
+        assert os.listdir(tmp_path) == ["00001.part"]
+
+class TestFileListPaging:
+
+    def setup_method(self):
+        # A file type of its own keeps other tests' files out of the pages
+        self.file_type = f"paging{uuid.uuid4().hex[:8]}"
+        self.now = datetime.utcnow().replace(microsecond=0)
+        # Three files per timestamp, so pages have to break ties on _id
+        self.files = [
+            {
+                "filename": f"{'report' if number % 2 == 0 else 'notes'}-{number}.docx",
+                "file_type": self.file_type,
+                "uploader": "ops",
+                "uploaded_at": self.now - timedelta(minutes=number // 3),
+            }
+            for number in range(7)
+        ]
+        run_db(db.files.insert_many, self.files)
+        self.headers = {"Authorization": f"Bearer {auth_utils.create_jwt_token('client@test.com', 'client')}"}
+
+    def teardown_method(self):
+        run_db(db.files.delete_many, {"file_type": self.file_type})
+
+    def walk(self, **params):
+        seen, pages, cursor = [], 0, None
+        while True:
+            query = {"file_type": self.file_type, "limit": 2, **params}
+            if cursor:
+                query["cursor"] = cursor
+            response = client.get("/file/list", params=query, headers=self.headers)
+            assert response.status_code == 200
+            body = response.json()
+            seen += [file["file_id"] for file in body["files"]]
+            pages += 1
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return seen, pages
+
+    def expected(self, files):
+        ordered = sorted(files, key=lambda file: (file["uploaded_at"], file["_id"]), reverse=True)
+        return [str(file["_id"]) for file in ordered]
+
+    def test_pages_cover_every_file_once_in_order(self):
+        seen, pages = self.walk()
+        assert pages == 4
+        assert seen == self.expected(self.files)
+
+    def test_filters_hold_across_pages(self):
+        seen, _ = self.walk(prefix="report")
+        assert seen == self.expected([file for file in self.files if file["filename"].startswith("report")])
+
+        seen, pages = self.walk(uploaded_after=(self.now - timedelta(minutes=1)).isoformat())
+        assert pages == 3
+        assert seen == self.expected([file for file in self.files if file["uploaded_at"] >= self.now - timedelta(minutes=1)])
+
+    def test_cursor_round_trip(self):
+        file = {"_id": ObjectId(), "uploaded_at": datetime(2024, 5, 1, 12, 30, 0, 123000)}
+        assert file_routes._decode_cursor(file_routes._encode_cursor(file)) == (file["uploaded_at"], file["_id"])
+        response = client.get("/file/list", params={"cursor": "not-a-cursor"}, headers=self.headers)
+        assert response.status_code == 400
+
+class TestBatchUpload:
+
+    def test_failed_insert_only_fails_its_own_file(self, monkeypatch):
+        taken = ObjectId()
+        run_db(db.files.insert_one, {"_id": taken, "filename": "taken.docx", "file_type": "batchtest"})
+        new_file_meta = file_routes._new_file_meta
+
+        def colliding_meta(filename, ext, blob, expires_at=None):
+            file_meta = new_file_meta(filename, ext, blob, expires_at)
+            if filename == "clash.xlsx":
+                file_meta["_id"] = taken
+            return file_meta
+
+        monkeypatch.setattr(file_routes, "_new_file_meta", colliding_meta)
+        contents = {name: f"{name} {uuid.uuid4().hex}".encode() for name in ("one.docx", "clash.xlsx", "two.pptx")}
+        headers = {"Authorization": f"Bearer {auth_utils.create_jwt_token('ops@test.com', 'ops')}"}
+        files = [("files", (name, content, "application/octet-stream")) for name, content in contents.items()]
+        try:
+            response = client.post("/file/upload/batch", files=files, headers=headers)
+            assert response.status_code == 200
+            body = response.json()
+            assert (body["uploaded"], body["failed"]) == (2, 1)
+            assert [result["status"] for result in body["results"]] == ["uploaded", "failed", "uploaded"]
+            assert body["results"][1]["error"] == "Could not save file metadata"
+
+            refcounts = {}
+            for name, content in contents.items():
+                blob = run_db(db.blobs.find_one, {"_id": hashlib.sha256(content).hexdigest()})
+                refcounts[name] = blob["refcount"] if blob else 0
+            assert refcounts == {"one.docx": 1, "clash.xlsx": 0, "two.pptx": 1}
+        finally:
+            run_db(db.files.delete_many, {"$or": [
+                {"_id": taken}, {"filename": {"$in": list(contents)}}
+            ]})
+
+class TestRangeRequests:
+
+    def test_single_and_suffix_ranges(self):
+        assert parse_range_header("bytes=10-19", 100) == [(10, 19)]
+        assert parse_range_header("bytes=90-", 100) == [(90, 99)]
+        assert parse_range_header("bytes=-5", 100) == [(95, 99)]
+        assert parse_range_header("bytes=50-500", 100) == [(50, 99)]
+
+    def test_overlapping_ranges_are_coalesced(self):
+        assert parse_range_header("bytes=0-1,5-6,3-4", 100) == [(0, 1), (3, 6)]
+
+    def test_malformed_ranges_are_ignored(self):
+        assert parse_range_header("items=0-1", 100) is None
+        assert parse_range_header("bytes=5-2", 100) is None
+        assert parse_range_header("bytes=a-b", 100) is None
+
+    def test_unsatisfiable_range(self):
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range_header("bytes=200-", 100)
+
+    def test_download_use_counted_whenever_byte_zero_is_served(self):
+        etag, modified = '"abc"', datetime(2024, 1, 1)
+
+        def starts(method="GET", **headers):
+            raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+            request = Request({"type": "http", "method": method, "path": "/", "headers": raw})
+            return starts_download(request, 100, etag, modified)
+
+        assert starts()
+        assert starts(range="bytes=0-")
+        assert starts(range="BYTES=0-9")
+        assert starts(range="bytes=-100")
+        assert starts(range="bytes=1-,0-0")
+        assert starts(range="bytes=a-b")
+        # A stale If-Range makes the server send the whole file
+        assert starts(range="bytes=50-", if_range='"stale"')
+        assert not starts(range="bytes=50-")
+        assert not starts(range="bytes=50-", if_range=etag)
+        assert not starts(range="bytes=200-")
+        assert not starts(if_none_match=etag)
+        assert not starts(method="HEAD")
+
+    def test_evicted_descriptor_closes_after_last_reader(self, tmp_path):
+        path = tmp_path / "blob"
+        path.write_bytes(b"0123456789")
+        source = asyncio.run(open_local_source(str(path), cacheable=True))
+        assert asyncio.run(source.read(2, 3)) == b"234"
+
+        cache = FileHandleCache(maxsize=0)
+        cache.put(source.handle)
+        os.fstat(source.handle.fd)
+        source.close()
+        with pytest.raises(OSError):
+            os.fstat(source.handle.fd)
+
+class TestZipStream:
+
+    def test_streamed_archive_round_trips(self, tmp_path):
+        contents = {"deck.pptx": os.urandom(70000), "notes.docx": b"hello"}
+        entries, taken = [], set()
+        for name, data in contents.items():
+            path = tmp_path / name
+            path.write_bytes(data)
+            entries.append((
+                unique_arcname(name, taken),
+                len(data),
+                datetime(2026, 1, 1),
+                lambda path=str(path): open_local_source(path)
+            ))
+
+        async def collect():
+            return b"".join([chunk async for chunk in stream_zip(entries)])
+
+        archive = zipfile.ZipFile(io.BytesIO(asyncio.run(collect())))
+        assert archive.testzip() is None
+        for info in archive.infolist():
+            assert info.compress_type == zipfile.ZIP_STORED
+            assert archive.read(info.filename) == contents[info.filename]
+
+    def test_duplicate_names_are_renamed(self):
+        taken = set()
+        assert unique_arcname("a.docx", taken) == "a.docx"
+        assert unique_arcname("a.docx", taken) == "a (2).docx"
+
+class TestPasswordPool:
+
+    def test_rehash_when_cost_changes(self):
+        weaker = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("password123")
+        valid, new_hash = asyncio.run(auth_utils.verify_and_update_password("password123", weaker))
+        assert valid
+        assert new_hash.startswith(f"$2b${auth_utils.BCRYPT_ROUNDS:02d}$")
+
+    def test_saturated_pool_returns_503(self, monkeypatch):
+        monkeypatch.setattr(auth_utils, "PASSWORD_HASH_QUEUE_SIZE", -auth_utils.PASSWORD_HASH_WORKERS)
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(auth_utils.hash_password_async("password123"))
+        assert exc.value.status_code == 503
+        assert exc.value.headers["Retry-After"] == "1"
+
+class TestTokenEngine:
+
+    def _ed25519_pem(self):
+        return ed25519.Ed25519PrivateKey.generate().private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ).decode()
+
+    def test_rotation_keeps_old_tokens_valid(self):
+        legacy = SigningKey("legacy", "HS256", secret="old-secret")
+        current = SigningKey("2026-10", "EdDSA", private_key=self._ed25519_pem())
+        engine = TokenEngine([legacy, current], "2026-10", fallback_kid="legacy")
+
+        token = engine.encode({"sub": "ops@test.com", "role": "ops"})
+        assert jwt.get_unverified_header(token)["kid"] == "2026-10"
+        assert engine.decode(token)["role"] == "ops"
+
+        pre_rotation = jwt.encode({"sub": "client@test.com"}, "old-secret", algorithm="HS256")
+        assert engine.decode(pre_rotation)["sub"] == "client@test.com"
+
+    def test_rejects_algorithm_swap(self):
+        engine = TokenEngine([
+            SigningKey("hs", "HS256", secret="secret"),
+            SigningKey("ed", "EdDSA", private_key=self._ed25519_pem())
+        ], "ed")
+        forged = jwt.encode({"sub": "x"}, "secret", algorithm="HS256", headers={"kid": "ed"})
+        with pytest.raises(JWTError):
+            engine.decode(forged)
+
+    def test_verified_claims_are_cached(self):
+        token = auth_utils.create_jwt_token("client@test.com", "client")
+        assert asyncio.run(auth_utils.verify_user_type(token)) == "client"
+        hits = auth_utils.token_cache_stats()["hits"]
+        assert asyncio.run(auth_utils.verify_user_type(token)) == "client"
+        assert auth_utils.token_cache_stats()["hits"] == hits + 1
+
+class FakeRedis:
+    """Local stand-in for the shared metadata cache."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+class TestMetadataCache:
+
+    def test_shared_backend_round_trip_and_invalidation(self):
+        fake = FakeRedis()
+        metadata_cache.set_shared_backend(metadata_cache.RedisCacheBackend(fake, ttl=60))
+        try:
+            meta = {"_id": ObjectId(), "filename": "deck.pptx", "uploaded_at": datetime(2026, 1, 1)}
+            file_id = str(meta["_id"])
+            asyncio.run(metadata_cache.cache_file_meta(meta))
+
+            # Another replica with a cold local cache is served from the shared tier
+            metadata_cache._local_cache.clear()
+            assert asyncio.run(metadata_cache.get_file_meta(file_id)) == meta
+
+            asyncio.run(metadata_cache.invalidate_file_meta(file_id))
+            assert fake.store == {}
+            assert metadata_cache._local_cache.get(file_id) is None
+        finally:
+            metadata_cache.set_shared_backend(None)
+
+    def test_malformed_file_id(self):
+        assert asyncio.run(metadata_cache.get_file_meta("not-an-object-id")) is None
+
+class TestBlobEncryption:
+
+    def _encrypt(self, plaintext, chunk_size=1024):
+        encryptor = encryption.BlobEncryptor(chunk_size)
+        return encryptor.header + encryptor.update(plaintext) + encryptor.finalize()
+
+    def test_round_trip_and_ranges(self, monkeypatch):
+        monkeypatch.setattr(encryption, "_master_key", os.urandom(32))
+        plaintext = os.urandom(5000)
+        blob = self._encrypt(plaintext)
+        assert encryption.is_encrypted_header(blob)
+        assert len(blob) == encryption.ciphertext_size(len(plaintext), 1024)
+
+        decryptor = encryption.BlobDecryptor(blob[:encryption.HEADER.size], len(blob))
+        assert decryptor.plaintext_size == len(plaintext)
+        for offset, length in [(0, 5000), (1000, 100), (1023, 2), (4999, 1)]:
+            first, start, span = decryptor.ciphertext_span(offset, length)
+            chunk = decryptor.decrypt_span(first, blob[start:start + span], offset, length)
+            assert chunk == plaintext[offset:offset + length]
+
+    def test_tampered_or_truncated_blob_is_rejected(self, monkeypatch):
+        monkeypatch.setattr(encryption, "_master_key", os.urandom(32))
+        blob = bytearray(self._encrypt(os.urandom(3000)))
+        header = bytes(blob[:encryption.HEADER.size])
+        blob[-5] ^= 1
+        decryptor = encryption.BlobDecryptor(header, len(blob))
+        first, start, span = decryptor.ciphertext_span(2500, 10)
+        with pytest.raises(InvalidTag):
+            decryptor.decrypt_span(first, bytes(blob[start:start + span]), 2500, 10)
+
+        # Dropping the final chunk leaves a chunk that was not sealed as the last one
+        truncated = bytes(blob[:-(3000 - 2048 + encryption.TAG_SIZE)])
+        decryptor = encryption.BlobDecryptor(header, len(truncated))
+        first, start, span = decryptor.ciphertext_span(1024, 10)
+        with pytest.raises(InvalidTag):
+            decryptor.decrypt_span(first, truncated[start:start + span], 1024, 10)
+
+class TestS3Storage:
+
+    @pytest.fixture
+    def s3(self, monkeypatch, tmp_path):
+        moto = pytest.importorskip("moto")
+        from boto3.s3.transfer import TransferConfig
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            monkeypatch.setenv(name, "testing")
+        with moto.mock_aws():
+            driver = storage.build_s3_storage(bucket="test-files")
+            # 5 MB is the smallest part S3 accepts
+            driver.transfer_config = TransferConfig(
+                multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024, max_concurrency=4
+            )
+            driver.client.create_bucket(Bucket="test-files")
+            yield driver
+
+    def _incoming(self, tmp_path, data):
+        path = tmp_path / os.urandom(4).hex()
+        path.write_bytes(data)
+        return str(path)
+
+    def test_multipart_commit_and_sequential_reads(self, s3, tmp_path):
+        data = os.urandom(11 * 1024 * 1024)
+        incoming = self._incoming(tmp_path, data)
+        assert asyncio.run(s3.commit(incoming, "ab" * 32, False)) == (True, False)
+        assert not os.path.exists(incoming)
+        assert s3.client.head_object(Bucket="test-files", Key=s3.key("ab" * 32))["ETag"].endswith('-3"')
+
+        # Content that is already stored is not uploaded again
+        assert asyncio.run(s3.commit(self._incoming(tmp_path, data), "ab" * 32, False)) == (False, False)
+
+        source = asyncio.run(s3.open("ab" * 32))
+        try:
+            assert asyncio.run(source.read(0, 1000)) == data[:1000]
+            assert asyncio.run(source.read(1000, 1000)) == data[1000:2000]
+            assert asyncio.run(source.read(9_000_000, 10)) == data[9_000_000:9_000_010]
+        finally:
+            source.close()
+
+    def test_missing_object_and_presigned_url(self, s3):
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(s3.open("cd" * 32))
+        url = s3.presigned_url("cd" * 32, "deck final.pptx")
+        assert s3.key("cd" * 32) in url
+        assert "response-content-disposition" in url and "Expires=" in url
+
+class TestMetrics:
+
+    def test_histogram_exposition(self):
+        histogram = Histogram("test_op_seconds", "Test operation", ("op",), buckets=(0.1, 1))
+        histogram.observe(0.05, op="read")
+        histogram.observe(0.5, op="read")
+        histogram.observe(5, op="read")
+        lines = histogram.render()
+        assert "# TYPE test_op_seconds histogram" in lines
+        assert 'test_op_seconds_bucket{op="read",le="0.1"} 1' in lines
+        assert 'test_op_seconds_bucket{op="read",le="1"} 2' in lines
+        assert 'test_op_seconds_bucket{op="read",le="+Inf"} 3' in lines
+        assert 'test_op_seconds_count{op="read"} 3' in lines
+
+    def test_requests_are_labelled_by_route_template(self):
+        client = TestClient(app)
+        client.get("/health")
+        client.get("/file/actual-download/not-a-token")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in body
+        assert 'route="/file/actual-download/{token}",status="401"' in body
+        assert "not-a-token" not in body
+        assert "http_requests_in_progress 1" in body
+
+    def test_mongo_command_timer(self):
+        class Event:
+            command_name = "find"
+            command = {"find": "files", "filter": {}}
+            connection_id = ("localhost", 27017)
+            request_id = 7
+            duration_micros = 2500
+
+        timer = MongoCommandTimer()
+        timer.started(Event)
+        timer.succeeded(Event)
+        assert 'mongo_command_duration_seconds_count{command="find",collection="files",outcome="ok"}' in "\n".join(
+            mongo_command_duration_seconds.render()
+        )
+
+def _ooxml(parts: dict):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in parts.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+class TestOfficeExtraction:
+    W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    A = 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+
+    def test_docx_text_pages_and_thumbnail(self):
+        document = _ooxml({
+            "word/document.xml": f'<w:document {self.W}><w:body>'
+                                 '<w:p><w:r><w:t>Quarterly </w:t></w:r><w:r><w:t>revenue</w:t></w:r></w:p>'
+                                 '<w:p><w:r><w:t>Outlook</w:t></w:r></w:p></w:body></w:document>',
+            "docProps/app.xml": '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/'
+                                'extended-properties"><Pages>7</Pages></Properties>',
+            "docProps/thumbnail.jpeg": b"\xff\xd8preview",
+        })
+        details = extract_office_document(document, "docx")
+        assert details["text"] == "Quarterly revenue\nOutlook"
+        assert details["page_count"] == 7
+        assert details["thumbnail"] == (b"\xff\xd8preview", "image/jpeg")
+
+    def test_pptx_slides_in_order(self):
+        slide = '<p:sld xmlns:p="p" {}><a:p><a:r><a:t>{}</a:t></a:r></a:p></p:sld>'
+        document = _ooxml({
+            "ppt/slides/slide10.xml": slide.format(self.A, "Ten"),
+            "ppt/slides/slide2.xml": slide.format(self.A, "Two"),
+            "ppt/slides/slide1.xml": slide.format(self.A, "One"),
+        })
+        details = extract_office_document(document, "pptx")
+        assert details["text"] == "One\nTwo\nTen"
+        assert details["page_count"] == 3
+        assert details["thumbnail"] is None
+
+    def test_invalid_document(self):
+        with pytest.raises(OfficeDocumentError):
+            extract_office_document(io.BytesIO(b"not a zip"), "xlsx")
+
+class TestRateLimits:
+
+    def _request(self, ip):
+        return Request({"type": "http", "method": "POST", "path": "/auth/client/login", "headers": [], "client": (ip, 1234)})
+
+    def test_token_bucket_refills(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+        store = rate_limit.MemoryBucketStore()
+        assert asyncio.run(store.take("k", 1.0, 2)) == 0
+        assert asyncio.run(store.take("k", 1.0, 2)) == 0
+        assert asyncio.run(store.take("k", 1.0, 2)) == pytest.approx(1.0)
+        now[0] += 1
+        assert asyncio.run(store.take("k", 1.0, 2)) == 0
+
+    def test_account_is_throttled_across_addresses(self):
+        for attempt in range(rate_limit.AUTH_ACCOUNT_BURST):
+            asyncio.run(rate_limit.enforce_auth_rate_limit(self._request(f"10.0.0.{attempt}"), "Victim@test.com"))
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(rate_limit.enforce_auth_rate_limit(self._request("10.0.1.1"), "victim@test.com"))
+        assert error.value.status_code == 429
+        assert int(error.value.headers["Retry-After"]) >= 1
+
+    def test_concurrency_caps(self):
+        limiter = rate_limit.ConcurrencyLimiter("test", global_limit=3, per_user_limit=2, retry_after=1)
+        assert limiter.try_acquire("a") is None
+        assert limiter.try_acquire("a") is None
+        assert limiter.try_acquire("a")[0] == 429
+        assert limiter.try_acquire("b") is None
+        assert limiter.try_acquire("c")[0] == 503
+        limiter.release("a")
+        assert limiter.try_acquire("c") is None
+
+class TestResponses:
+
+    def test_orjson_matches_default_encoding(self):
+        row = {"file_id": ObjectId(), "uploaded_at": datetime(2025, 1, 2, 3, 4, 5, 678000), "size": 3}
+        body = responses.ORJSONResponse(row).body
+        assert json.loads(body) == jsonable_encoder(row, custom_encoder={ObjectId: str})
+        assert responses.dumps_line(row).endswith(b"\n")
+
+    def test_msgpack_is_negotiated(self):
+        msgpack = pytest.importorskip("msgpack")
+        request = Request({"type": "http", "method": "GET", "path": "/file/list", "headers": [(b"accept", b"application/msgpack")]})
+        response = responses.negotiated_response(request, {"uploaded_at": datetime(2025, 1, 2)})
+        assert response.media_type == "application/msgpack"
+        assert response.headers["vary"] == "Accept"
+        assert msgpack.unpackb(response.body) == {"uploaded_at": "2025-01-02T00:00:00"}
+
+class TestRevocationIndex:
+
+    def test_jti_and_file_revocations(self):
+        index = RevocationIndex()
+        now = time.time()
+        index.add("abc", now, now + 60)
+        index.add("file:f1", now, now + 60)
+        assert index.revoked_reason("abc", "f2", now - 5) == "revoked"
+        assert index.revoked_reason("other", "f1", now - 5) == "revoked"
+        # Links to the file issued after the revocation stay valid
+        assert index.revoked_reason("other", "f1", now + 1) is None
+
+    def test_used_links_do_not_hide_revocations(self):
+        index = RevocationIndex()
+        now = time.time()
+        index.add("spent", now, now + 60, "used")
+        assert index.revoked_reason("spent", "f1", now - 5) == "used"
+        index.add("file:f1", now, now + 60)
+        assert index.revoked_reason("spent", "f1", now - 5) == "revoked"
+        index.add("spent", now, now + 60)
+        index.add("spent", now, now + 60, "used")
+        assert index.revoked_reason("spent", "f2", now - 5) == "revoked"
+
+    def test_entries_expire_with_their_tokens(self):
+        index = RevocationIndex()
+        now = time.time()
+        index.add("short", now, now + 10, "used")
+        index.add("long", now, now + 100)
+        index.prune(now + 50)
+        assert len(index) == 1
+        assert index.revoked_reason("short", "f", now) is None
+        assert index.revoked_reason("long", "f", now) == "revoked"
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        if self.fail:
+            raise RuntimeError("mongo down")
+        self.batches.append(list(documents))
+
+class TestAuditLog:
+
+    def test_batches_and_flush(self):
+        collection = FakeCollection()
+        log = AuditLog(collection, maxsize=100, batch_size=3, flush_interval=0.05, spill_path="")
+
+        async def scenario():
+            for number in range(4):
+                log.record("download", "client@test.com", file_id=str(number))
+            assert len(await log._next_batch()) == 3
+            await log._write(log._batch)
+            log._batch = []
+            await log.flush()
+
+        asyncio.run(scenario())
+        assert [len(batch) for batch in collection.batches] == [3, 1]
+        assert collection.batches[0][0]["meta"] == {"type": "download", "actor": "client@test.com"}
+
+    def test_backpressure_spills_and_replays(self, tmp_path):
+        spill_path = str(tmp_path / "spill.jsonl")
+        down = FakeCollection(fail=True)
+        log = AuditLog(down, maxsize=1, batch_size=10, spill_path=spill_path)
+        log.record("upload", "ops@test.com")
+        log.record("upload", "ops@test.com")
+        asyncio.run(log.flush())
+        with open(spill_path) as spill:
+            assert len(spill.readlines()) == 2
+
+        log.collection = FakeCollection()
+        asyncio.run(log.replay_spill())
+        assert len(log.collection.batches[0]) == 2
+        assert not os.path.exists(spill_path)
+
+class TestStorageStats:
+
+    def test_increments_by_type(self):
+        files = [{"file_type": "docx", "size": 10}, {"file_type": "docx", "size": 5}, {"file_type": "xlsx", "size": 1}]
+        assert stats._file_increments(files, -1) == {
+            "files": -3, "bytes": -16,
+            "by_type.docx.files": -2, "by_type.docx.bytes": -15,
+            "by_type.xlsx.files": -1, "by_type.xlsx.bytes": -1,
+        }
+
+    def test_stats_require_auth(self):
+        assert client.get("/ops/stats").status_code == 401
+        assert client.post("/ops/stats/reconcile").status_code == 401
+
+class TestRetention:
+
+    def test_sweeper_skips_dot_entries_and_fresh_files(self, tmp_path):
+        (tmp_path / ".audit").mkdir()
+        (tmp_path / ".spill").write_text("x")
+        (tmp_path / "old.docx").write_text("x")
+        os.utime(tmp_path / "old.docx", (1000, 1000))
+        (tmp_path / "new.docx").write_text("x")
+        assert [name for name, _, _ in retention._list_files(str(tmp_path))] == ["new.docx", "old.docx"]
+        assert not retention._remove_if_stale(str(tmp_path / "new.docx"), time.time() - 60)
+        assert retention._remove_if_stale(str(tmp_path / "old.docx"), time.time() - 60)
+        assert not (tmp_path / "old.docx").exists()
+
+    def test_delete_requires_auth(self):
+        assert client.delete(f"/file/{ObjectId()}").status_code == 401
+
+class TestServer:
+
+    def test_worker_count(self, monkeypatch):
+        monkeypatch.setenv("WEB_CONCURRENCY", "3")
+        assert server.worker_count() == 3
+        monkeypatch.setenv("WEB_CONCURRENCY", "")
+        assert server.worker_count() == server.available_cores()
+        monkeypatch.delenv("WEB_CONCURRENCY")
+        assert server.worker_count() == server.available_cores() >= 1
+
+    def test_health_reports_draining(self, monkeypatch):
+        assert client.get("/health").status_code == 200
+        monkeypatch.setattr(server, "_draining", True)
+        response = client.get("/health")
+        assert response.status_code == 503
+        assert response.json() == {"status": "draining"}
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"]) 
\ No newline at end of file